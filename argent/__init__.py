@@ -3,6 +3,7 @@
 """ A module for parsing command-line arguments and flags. """
 
 from argent.parser import Parser
+from argent.streams import Stream
 
 
-__all__ = ["Parser"]
+__all__ = ["Parser", "Stream"]
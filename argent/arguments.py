@@ -1,77 +1,179 @@
 # -*- coding: utf-8 -*-
 
-from inspect import getargspec
-import re
+import sys
+from argent.conversion import (bulk_converter_for, converter_for,
+        inferred_type, string_types, usable_type)
+from argent.docstrings import parse_docstring
+from argent.streams import as_stream
+from argent import trace
+
+
+# an `argent.cache.IntrospectionCache`, if one's been enabled. When it's None,
+# functions are introspected from scratch every time.
+cache = None
+
+
+# the flag on code objects of functions with `*args`.
+CO_VARARGS = 0x04
+
+
+def argspec(fn):
+    """Find the names of the positional arguments `fn` takes, and the name
+    of its `*args` if it has one. This reads them off its code object, since
+    importing `inspect` costs more than most commands take to run.
+    """
+    code = getattr(fn, "__code__", None)
+    if code is None:
+        # some other kind of callable; inspect knows what to do with those.
+        try:
+            from inspect import getfullargspec as getargspec
+        except ImportError:
+            from inspect import getargspec
+        return getargspec(fn)[:2]
+    count = code.co_argcount
+    args = list(code.co_varnames[:count])
+    varargs = None
+    if code.co_flags & CO_VARARGS:
+        # it comes after any keyword-only arguments.
+        varargs = code.co_varnames[count
+                + getattr(code, "co_kwonlyargcount", 0)]
+    return args, varargs
+
+
+def introspect(fn):
+    """Given a function, find the names of its arguments and the descriptions
+    and synonyms of them from its docstring. These are the parts that don't
+    change from one run to the next, so they're what can be cached.
+    """
+    args, varargs = argspec(fn)
+    # find the descriptions and synonyms of flags and arguments from the
+    # docstring; see argent.docstrings for how they're written.
+    descriptions, synonyms = parse_docstring(fn.__doc__)
+    return args, varargs, descriptions, synonyms
 
 
 def arguments_from_function(fn):
     """Given a function, use introspective magic to make inferences about
     its arguments.
     """
+    if trace.active:
+        start = trace.clock()
     arguments = [help_arg]
-    args, _, _, defaults = getargspec(fn)
-    # find the descriptions and synonyms of flags and arguments from the
-    # docstring: any string after the first that starts with a name + ":"
-    # has a description following it. The name may be some comma-seperated,
-    # in which case those are synonyms and the first one is the canonical name
-    descriptions = {}
-    synonyms = {}
-    if fn.__doc__:
-        for m in re.finditer(r'^\s*(.+?)\s*:\s?(.+?)\s*$', fn.__doc__, 
-                re.MULTILINE):
-            these_synonyms = re.split(r',\s?', m.group(1))
-            # the first synonym is the canonical name
-            name = these_synonyms[0].replace("-", "_")
-            descriptions[name] = m.group(2)
-            synonyms[name] = these_synonyms[1:]
-    # if defaults is None, make it a zero-length tuple, rather than None.
-    # this way we can get its length.
-    if not defaults:
-        defaults = ()
+    spec = cache.get(fn) if cache is not None else None
+    cached = spec is not None
+    if spec is None:
+        spec = introspect(fn)
+        if cache is not None:
+            cache.put(fn, spec)
+    args, varargs, descriptions, synonyms = spec
+    # defaults can be anything at all, so they always come from the function
+    # itself. if there aren't any, make it a zero-length tuple, rather than
+    # None. this way we can get its length.
+    defaults = fn.__defaults__ or ()
     # pad the defaults list with Nones in order to give it the same number
     # of items as args, so we can zip them.
     defaults = ([None] * (len(args) - len(defaults))) + list(defaults)
+    # annotations are the most explicit way to give an argument a type.
+    annotations = dict(getattr(fn, "__annotations__", None) or {})
+    for name, annotation in annotations.items():
+        # with `from __future__ import annotations`, they're all strings.
+        if isinstance(annotation, string_types):
+            try:
+                annotations[name] = eval(annotation,
+                        getattr(fn, "__globals__", {}))
+            except Exception:
+                annotations[name] = None
     # for each argument, make an Argument object out of it and append it.
     for arg, default in zip(args, defaults):
         arg_object = Argument(arg, default, descriptions.get(arg, ""), 
-                synonyms.get(arg, []))
+                synonyms.get(arg, []), annotations.get(arg))
         arguments.append(arg_object)
+    # `*args` takes any number of extra positional arguments.
+    if varargs:
+        arguments.append(Argument(varargs, None,
+            descriptions.get(varargs, ""), synonyms.get(varargs, []),
+            annotations.get(varargs), variadic=True))
+    if trace.active:
+        trace.emit("introspect", start, function=fn.__name__, cached=cached,
+                arguments=len(arguments) - 1)
     return arguments
 
 
+# names are interned, so that the thousands of arguments in a big program that
+# share a name share one string for it.
+intern = getattr(sys, "intern", None) or intern
+
+
 class Argument(object):
     "A class to handle arguments and their metadata."
-    def __init__(self, name, default=None, description="", synonyms=None):
+    __slots__ = ("name", "underscored", "default", "variadic", "flag",
+            "necessary", "type", "converter", "description", "synonym_names")
+
+    def __init__(self, name, default=None, description="", synonyms=None,
+            type=None, variadic=False):
         # `self.name` is what we get but with no underscores and all dashes.
-        self.name = name.replace("_", "-")
+        self.name = intern(name.replace("_", "-"))
         # `self.underscored` is the opposite.
-        self.underscored = name.replace("-", "_")
+        self.underscored = intern(name.replace("-", "_"))
         # this is the default value; can be None if there isn't one.
         self.default = default
+        # this is True for `*args`, which takes any number of values.
+        self.variadic = variadic
         # if the name starts with an underscore or dash, it's a flag,
         # and so the default should be False
-        if self.name.startswith("-"):
+        if self.name.startswith("-") and not variadic:
             self.flag = True
             self.default = False
         else:
             self.flag = False
-        # if default is None, it's necessary
-        if default == None:
+        stream = as_stream(type) or as_stream(default)
+        # if default is None, it's necessary -- unless it's a stream, which
+        # reads from stdin when it isn't given.
+        if variadic or stream is not None:
+            self.necessary = False
+        elif default == None:
             self.necessary = True
         # if there is a default, it's not necessary.
         else:
             self.necessary = False
+        # the type to convert values to: the one we're given, or else the
+        # type of the default, if that says anything. flags are always
+        # booleans, and streams are their own types.
+        type = usable_type(type)
+        if self.flag:
+            self.type = bool
+        elif stream is not None:
+            self.type = stream
+        elif type is None:
+            self.type = inferred_type(default)
+        else:
+            self.type = type
+        # this converts a value from the command line to `self.type` (or,
+        # for `*args`, all of its values at once); it's None if there's
+        # nothing to do. flags don't need converting.
+        if self.flag:
+            self.converter = None
+        elif variadic:
+            self.converter = bulk_converter_for(self.type)
+        else:
+            self.converter = converter_for(self.type)
         # description is nothing for now.
         self.description = description
         # synonyms -- other names this thing can be used as.
         # e.g, '--h' can also be '--help'.
-        # these follow the rules for `self.name` and `self.underscored`.
-        self.synonym_names = [self.name] + [s.replace("_", "-")
-                for s in synonyms]
-        self.synonyms_underscored = [self.underscored] + [s.replace("-", "_")
-                for s in synonyms]
-        # these are __all__ the possible names for this argument
-        self.variants = self.synonym_names + self.synonyms_underscored
+        # these follow the rules for `self.name`.
+        self.synonym_names = (self.name,) + tuple(intern(s.replace("_", "-"))
+                for s in synonyms or ())
+
+    @property
+    def synonyms_underscored(self):
+        "The synonyms, following the rules for `self.underscored`."
+        return [s.replace("-", "_") for s in self.synonym_names]
+
+    @property
+    def variants(self):
+        "These are __all__ the possible names for this argument."
+        return list(self.synonym_names) + self.synonyms_underscored
 
     def is_in(self, list):
         "Determine whether this argument or its variants are in a list."
@@ -83,3 +185,7 @@ class Argument(object):
 
 help_arg = Argument("--h", None, "Display this help message and exit.",
         synonyms=["--help"])
+
+# parsers that cache their results take this to skip the cache.
+no_cache_arg = Argument("--no-cache", None,
+        "Run the command without using cached results.")
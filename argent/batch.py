@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+""" Running many command lines through one parser, in one process. """
+
+from collections import namedtuple
+import shlex
+import sys
+
+from argent.conversion import string_types
+from argent.output import emit
+
+# what happened to one command line: the arguments it was split into, and
+# either what the function returned or the exception it raised.
+Outcome = namedtuple("Outcome", ["arguments", "result", "error"])
+
+
+def split(command_line):
+    """Split `command_line` into arguments like a shell would. Lines without
+    any quotes or backslashes, which are most of them, are just split on
+    whitespace, since that's the same and much faster.
+    """
+    if "'" in command_line or '"' in command_line or "\\" in command_line:
+        return shlex.split(command_line)
+    return command_line.split()
+
+
+def attempt(parser, command_line):
+    """Split `command_line` if it's a string, parse it with `parser` and
+    return an `Outcome`.
+    """
+    arguments = None
+    try:
+        if isinstance(command_line, string_types):
+            arguments = split(command_line)
+        else:
+            arguments = list(command_line)
+        return Outcome(arguments, parser.parse(arguments), None)
+    except Exception as e:
+        return Outcome(arguments, None, e)
+
+
+# worker processes get the parser through this; see `_initialize`.
+_parser = None
+
+
+def _initialize(parser):
+    "Give a worker process the parser, however it was started."
+    global _parser
+    _parser = parser
+
+
+def _attempt(command_line):
+    return attempt(_parser, command_line)
+
+
+def parse_many(parser, command_lines, processes=None, chunksize=64):
+    """Parse each of `command_lines` with `parser`, yielding an `Outcome` for
+    each of them in order. If `processes` is given, spread them across that
+    many worker processes.
+    """
+    if not processes:
+        for command_line in command_lines:
+            yield attempt(parser, command_line)
+        return
+    import multiprocessing
+    try:
+        # forked workers get the parser without it having to be pickled,
+        # whatever the default way of starting processes is.
+        context = multiprocessing.get_context("fork")
+    except (AttributeError, ValueError):
+        # python 2 always forks on posix; elsewhere, it'll be pickled.
+        context = multiprocessing
+    pool = context.Pool(processes, _initialize, (parser,))
+    try:
+        for outcome in pool.imap(_attempt, command_lines, chunksize):
+            yield outcome
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def read_command_lines(stream, null=False, size=64 * 1024):
+    """Lazily read command lines from `stream`, one per line or, if `null`,
+    separated by NUL characters. Empty command lines are skipped.
+    """
+    if not null:
+        for line in stream:
+            line = line.rstrip("\r\n")
+            if line:
+                yield line
+        return
+    leftover = ""
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        pieces = (leftover + chunk).split("\0")
+        leftover = pieces.pop()
+        for piece in pieces:
+            if piece:
+                yield piece
+    if leftover:
+        yield leftover
+
+
+def run_batch(parser, arguments):
+    """Handle `--batch [--null] [FILE]`: run every command line in FILE (or
+    stdin), printing results to stdout and errors to stderr. Return the
+    number of command lines that failed.
+    """
+    null = "--null" in arguments
+    paths = [a for a in arguments if a != "--null"]
+    if paths and paths[0] != "-":
+        stream = open(paths[0])
+    else:
+        stream = sys.stdin
+    failures = 0
+    try:
+        outcomes = parse_many(parser, read_command_lines(stream, null))
+        for number, outcome in enumerate(outcomes, 1):
+            if outcome.error is not None:
+                failures += 1
+                sys.stderr.write("line %d: %s\n" % (number, outcome.error))
+            elif not emit(outcome.result, parser.output or "plain"):
+                # whoever was reading the results has gone away.
+                break
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return failures
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+""" On-disk caches, so that work done in one run of a program can be reused
+by the next. """
+
+from hashlib import sha1
+import marshal
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+from argent.streams import Reader
+
+
+def default_directory():
+    "Find the directory argent keeps its caches in, by default."
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "argent")
+
+
+def enable(directory=None, max_size=4 * 1024 * 1024):
+    """Cache the results of introspecting functions in `directory`, keeping
+    it under `max_size` bytes. Return the cache.
+    """
+    from argent import arguments
+    arguments.cache = IntrospectionCache(directory, max_size)
+    return arguments.cache
+
+
+def disable():
+    "Stop caching introspection results."
+    from argent import arguments
+    arguments.cache = None
+
+
+class DirectoryCache(object):
+    """A directory of cache entries, one file each, that deletes the least
+    recently used ones once they take up more than `max_size` bytes.
+    """
+    # once it's over its maximum size, a cache evicts down to this fraction
+    # of it, so that it isn't evicting again with every write.
+    low_water = 0.75
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        # the most this cache should take up on disk, in bytes.
+        self.max_size = max_size
+        # what the entries take up, as far as we know; it's counted the
+        # first time anything is written, and kept up to date after that.
+        self._size = None
+
+    def read(self, key):
+        "Return the data stored under `key`, or None if there isn't any."
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # mark this entry as recently used, for eviction.
+            os.utime(path, None)
+        except (IOError, OSError):
+            return None
+        return data
+
+    def write(self, key, data):
+        "Store `data` under `key`."
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            # write to a temporary file and then move it into place, so
+            # that nobody ever reads half of an entry.
+            handle, temporary = tempfile.mkstemp(dir=self.directory,
+                    prefix=".")
+            with os.fdopen(handle, "wb") as f:
+                f.write(data)
+            path = os.path.join(self.directory, key)
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self.entries())
+            # an entry that's replaced doesn't take up room any more.
+            try:
+                self._size -= os.stat(path).st_size
+            except OSError:
+                pass
+            os.rename(temporary, path)
+            self._size += len(data)
+            if self._size > self.max_size:
+                self.evict()
+        except (IOError, OSError):
+            # caching is only ever an optimization.
+            pass
+
+    def entries(self):
+        "List the last use, size and name of every entry."
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith("."):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    def evict(self):
+        """Delete the least recently used entries until we're well under
+        max_size.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        # oldest first.
+        for _, size, name in sorted(entries):
+            if total <= self.max_size * self.low_water:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+        self._size = total
+
+    def clear(self):
+        "Delete everything in this cache."
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                os.remove(os.path.join(self.directory, name))
+        self._size = None
+
+
+def function_digest(fn):
+    """Start a hash that identifies a function by its qualified name and its
+    code, so that editing the function changes it.
+    """
+    digest = sha1()
+    # marshalled data isn't portable between python versions.
+    digest.update(("%d.%d\0" % sys.version_info[:2]).encode("ascii"))
+    digest.update(("%s.%s\0" % (fn.__module__, fn.__name__)).encode("utf-8"))
+    digest.update(marshal.dumps(fn.__code__))
+    return digest
+
+
+def modified(value):
+    """If `value` is the path of a file or directory that exists, return
+    when it was last modified and its size; otherwise return None.
+    """
+    path = getattr(value, "__fspath__", None)
+    path = path() if path is not None else value
+    if not isinstance(path, (str, type(u""), bytes)):
+        return None
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError, TypeError):
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+class IntrospectionCache(DirectoryCache):
+    """A cache of what `argent.arguments.introspect` finds out about functions.
+    Each function gets a file, named by a hash of its qualified name, its code
+    and its docstring, so that changing any of those misses the cache.
+    """
+    # this changes whenever what gets cached does.
+    version = 3
+
+    def __init__(self, directory=None, max_size=4 * 1024 * 1024):
+        DirectoryCache.__init__(self, directory or os.path.join(
+            default_directory(), "introspection"), max_size)
+
+    def key(self, fn):
+        "Determine the name of the file for `fn`."
+        digest = function_digest(fn)
+        digest.update(("%d\0" % self.version).encode("ascii"))
+        digest.update((fn.__doc__ or "").encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, fn):
+        "Return the cached spec for `fn`, or None if there isn't one."
+        data = self.read(self.key(fn))
+        try:
+            return marshal.loads(data) if data is not None else None
+        except (EOFError, ValueError, TypeError):
+            return None
+
+    def put(self, fn, spec):
+        "Store `spec` as the cached spec for `fn`."
+        try:
+            data = marshal.dumps(spec)
+        except ValueError:
+            return
+        self.write(self.key(fn), data)
+
+
+class ResultCache(DirectoryCache):
+    """A cache of what commands return, for commands that always return the
+    same thing given the same arguments. Results are keyed by the function,
+    the arguments it's called with and the working directory, and expire
+    after `ttl` seconds if that's given. With `paths`, they're also keyed by
+    when the files and directories the arguments name were last modified, so
+    that changing those misses the cache. Results that can't be pickled,
+    results that are iterators and calls with arguments that can't be
+    pickled (like streams) aren't cached.
+    """
+    def __init__(self, directory=None, ttl=None, max_size=64 * 1024 * 1024,
+            paths=False):
+        DirectoryCache.__init__(self, directory or os.path.join(
+            default_directory(), "results"), max_size)
+        self.ttl = ttl
+        self.paths = paths
+
+    def key(self, fn, args, kwargs):
+        """Determine the name of the file for calling `fn` with `args` and
+        `kwargs`, or return None if they can't be cached.
+        """
+        kwargs = sorted(kwargs.items())
+        values = list(args) + [value for _, value in kwargs]
+        # what a stream reads isn't in its arguments.
+        if any(isinstance(value, Reader) for value in values):
+            return None
+        digest = function_digest(fn)
+        try:
+            # relative paths mean something else somewhere else.
+            digest.update(pickle.dumps((os.getcwd(), list(args), kwargs), 2))
+            if self.paths:
+                digest.update(pickle.dumps([modified(v) for v in values], 2))
+        except Exception:
+            return None
+        return digest.hexdigest()
+
+    def call(self, fn, args, kwargs, compute, fresh=False):
+        """Return the cached result of calling `fn` with `args` and `kwargs`,
+        or else call `compute` to get it and cache that. If `fresh`, always
+        call `compute`.
+        """
+        key = self.key(fn, args, kwargs)
+        if key is None:
+            return compute()
+        if not fresh:
+            found, result = self.lookup(key)
+            if found:
+                return result
+        result = compute()
+        self.store(key, result)
+        return result
+
+    def lookup(self, key):
+        """Return whether there's a result under `key` that hasn't expired,
+        and what it is.
+        """
+        data = self.read(key)
+        if data is None:
+            return False, None
+        try:
+            created, result = pickle.loads(data)
+        except Exception:
+            return False, None
+        if self.ttl is not None and time.time() - created >= self.ttl:
+            return False, None
+        return True, result
+
+    def store(self, key, result):
+        "Keep `result` under `key`, if it can be kept."
+        # iterators are for streaming, not for keeping.
+        if hasattr(result, "__next__") or hasattr(result, "next"):
+            return
+        try:
+            data = pickle.dumps((time.time(), result),
+                    pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return
+        self.write(key, data)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+""" A thin client for argent's daemon mode (see `argent.daemon`). It forwards
+its arguments, working directory, environment and stdin to a server that
+already has the program loaded, and relays back the output and exit code.
+This module doesn't import the rest of argent, so that it starts quickly:
+
+    python -m argent.client /path/to/program [ARGS...]
+"""
+
+from hashlib import sha1
+import errno
+import json
+import os
+import select
+import socket
+import stat
+import struct
+import sys
+import tempfile
+import time
+
+
+# every message is one of these headers followed by `length` bytes.
+HEADER = struct.Struct("!cI")
+# client to server: the request, and stdin (an empty one means EOF).
+REQUEST, STDIN = b"a", b"0"
+# server to client: stdout, stderr, the return value and the exit code.
+STDOUT, STDERR, RESULT, EXIT = b"1", b"2", b"r", b"x"
+
+
+def send_frame(sock, channel, data):
+    "Send `data` on `channel` over `sock`."
+    sock.sendall(HEADER.pack(channel, len(data)) + data)
+
+
+def _receive(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError("connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def receive_frame(sock):
+    "Receive a message from `sock`; return its channel and data."
+    channel, length = HEADER.unpack(_receive(sock, HEADER.size))
+    return channel, _receive(sock, length)
+
+
+# sending with this never waits for room in the socket.
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0x40)
+
+# the option for asking a Unix socket who's at the other end; python 2
+# doesn't name it.
+SO_PEERCRED = getattr(socket, "SO_PEERCRED",
+        17 if sys.platform.startswith("linux") else None)
+
+
+def private_directory(path):
+    """Make the directory `path` if it isn't there, and check that it belongs
+    to us and nobody else can get into it; return `path`.
+    """
+    try:
+        os.mkdir(path, 0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    # (lstat, so that a symlink to somebody else's directory doesn't count.)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() \
+            or info.st_mode & 0o077:
+        raise OSError(errno.EPERM, "Not a private directory", path)
+    return path
+
+
+def socket_directory():
+    """Determine the directory servers' sockets go in: one that only this
+    user can get into, since clients send their whole environment.
+    """
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime and os.path.isdir(runtime):
+        return private_directory(os.path.join(runtime, "argent"))
+    return private_directory(os.path.join(tempfile.gettempdir(),
+        "argent-%d" % os.getuid()))
+
+
+def socket_path(program):
+    "Determine the socket the server for `program` listens on."
+    program = os.path.realpath(program)
+    name = "%s.sock" % sha1(program.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(socket_directory(), name)
+
+
+def peer_uid(sock):
+    """Find out which user is at the other end of the Unix socket `sock`, or
+    return None if there's no way to tell on this platform.
+    """
+    if SO_PEERCRED is None:
+        return None
+    credentials = struct.Struct("3i")
+    data = sock.getsockopt(socket.SOL_SOCKET, SO_PEERCRED, credentials.size)
+    # these are the process, user and group ids.
+    return credentials.unpack(data)[1]
+
+
+def trusted(sock):
+    "Determine whether whoever is at the other end of `sock` is us."
+    uid = peer_uid(sock)
+    return uid is None or uid == os.getuid()
+
+
+def connect(path, server_command=None, timeout=10.0):
+    """Connect to the server listening at `path`. If there isn't one and a
+    `server_command` is given, start it in the background and wait for it.
+    """
+    deadline = time.time() + timeout
+    started = False
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except socket.error as e:
+            sock.close()
+            if e.errno not in (errno.ENOENT, errno.ECONNREFUSED) \
+                    or not server_command or time.time() > deadline:
+                raise
+        else:
+            # don't send anything to somebody else's server.
+            if not trusted(sock):
+                sock.close()
+                raise OSError(errno.EPERM, "Server belongs to another user",
+                        path)
+            return sock
+        if not started:
+            start_server(server_command)
+            started = True
+        time.sleep(0.01)
+
+
+def start_server(command):
+    "Start `command` detached from this process and its terminal."
+    import subprocess
+    with open(os.devnull, "r+b") as devnull:
+        subprocess.Popen(command, stdin=devnull, stdout=devnull,
+                stderr=devnull, close_fds=True, preexec_fn=os.setsid)
+
+
+def run(path, argv, stdin=None, stdout=None, stderr=None,
+        server_command=None):
+    """Run `argv` on the server at `path`, forwarding the file descriptor
+    `stdin` (if any) to it and writing its output to the binary streams
+    `stdout` and `stderr`. Return the exit code and the return value.
+    """
+    stdout = stdout or getattr(sys.stdout, "buffer", sys.stdout)
+    stderr = stderr or getattr(sys.stderr, "buffer", sys.stderr)
+    sock = connect(path, server_command)
+    code, result = 1, None
+    try:
+        request = {"argv": argv, "cwd": os.getcwd(),
+                "env": dict(os.environ)}
+        send_frame(sock, REQUEST, json.dumps(request).encode("utf-8"))
+        # stdin is only sent when the socket has room for it, so that we
+        # never wait on the server while it's waiting for us to read its
+        # output; this is what's waiting to be sent.
+        pending = b""
+        if stdin is None:
+            pending = HEADER.pack(STDIN, 0)
+        while True:
+            # (more is only read from stdin once what we had is all sent.)
+            readers = [sock] if pending or stdin is None else [sock, stdin]
+            writers = [sock] if pending else []
+            readable, writable, _ = select.select(readers, writers, [])
+            if stdin in readable:
+                data = os.read(stdin, 64 * 1024)
+                pending = HEADER.pack(STDIN, len(data)) + data
+                if not data:
+                    stdin = None
+            if sock in writable:
+                try:
+                    pending = pending[sock.send(pending, MSG_DONTWAIT):]
+                except socket.error as e:
+                    # a command that's finished without reading all of
+                    # stdin has still sent its output and exit code.
+                    if e.errno in (errno.EPIPE, errno.ECONNRESET):
+                        pending, stdin = b"", None
+                    elif e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        raise
+            if sock in readable:
+                channel, data = receive_frame(sock)
+                if channel == STDOUT:
+                    stdout.write(data)
+                    stdout.flush()
+                elif channel == STDERR:
+                    stderr.write(data)
+                    stderr.flush()
+                elif channel == RESULT:
+                    result = json.loads(data.decode("utf-8"))
+                elif channel == EXIT:
+                    code = int(data)
+                    break
+    finally:
+        sock.close()
+    return code, result
+
+
+def main(arguments=None):
+    arguments = sys.argv[1:] if arguments is None else arguments
+    if not arguments:
+        sys.stderr.write("usage: python -m argent.client PROGRAM [ARGS...]\n")
+        return 2
+    program = arguments[0]
+    code, _ = run(socket_path(program), arguments, stdin=0,
+            server_command=[sys.executable, program, "__serve"])
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
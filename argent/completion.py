@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+""" Shell completion from a prebuilt index of a parser tree, so that pressing
+TAB doesn't have to import and introspect every subcommand. """
+
+import json
+import os
+import sys
+from sys import argv
+
+
+def build_index(parser):
+    """Given a parser, return a dictionary of its subcommands (recursively),
+    flags and description, suitable for `complete`.
+    """
+    return {
+        "description": getattr(parser, "description", ""),
+        "flags": [[f.synonym_names, f.description] for f in parser.flags],
+        # this imports any lazy subparsers; building the index is the one
+        # time that's alright.
+        "subcommands": dict((name, build_index(subparser)) for name, subparser
+            in list(parser.subparsers.items())),
+    }
+
+
+def sources(parser, program=None):
+    """Find the modification times of the program and of the source files of
+    every function in the tree under `parser` that's been imported, so that
+    an index can tell when it's out of date.
+    """
+    from argent.parser import LazySubparser
+    paths = set([program or argv[0]])
+    parsers = [parser]
+    while parsers:
+        parser = parsers.pop()
+        module = sys.modules.get(getattr(parser.function, "__module__", None))
+        paths.add(getattr(module, "__file__", None))
+        # lazy subparsers that haven't been imported can't have changed yet.
+        parsers.extend(p for p in parser.subparsers.values()
+                if not isinstance(p, LazySubparser))
+    mtimes = {}
+    for path in paths:
+        if not path:
+            continue
+        # watch the source, rather than its bytecode.
+        if path.endswith((".pyc", ".pyo")):
+            path = path[:-1]
+        try:
+            mtimes[path] = os.path.getmtime(path)
+        except OSError:
+            pass
+    return mtimes
+
+
+def stale(index):
+    "Determine whether any of the files an index was built from have changed."
+    # indexes from before sources were recorded are always out of date.
+    if "sources" not in index:
+        return True
+    for path, mtime in index["sources"].items():
+        try:
+            if os.path.getmtime(path) != mtime:
+                return True
+        except OSError:
+            return True
+    return False
+
+
+def index_path(program=None):
+    """Determine where the index for `program` (by default, the one that's
+    running) lives: a hidden file next to it or, if that directory can't be
+    written to (like /usr/local/bin), a file in the user's cache directory.
+    """
+    program = os.path.realpath(program or argv[0])
+    directory, name = os.path.split(program)
+    if not os.access(directory, os.W_OK):
+        from hashlib import sha1
+        from argent.cache import default_directory
+        # programs with the same name in different places get their own.
+        digest = sha1(program.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(default_directory(), "completion",
+                "%s-%s.argent-index" % (name, digest))
+    return os.path.join(directory, ".%s.argent-index" % name)
+
+
+def build_stored_index(parser):
+    "Build the index for `parser`, with the sources it was built from."
+    index = build_index(parser)
+    # building the index imported the whole tree, so this covers all of it.
+    index["sources"] = sources(parser)
+    return index
+
+
+def store(index, path):
+    "Store `index` at `path`, making its directory if there isn't one."
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+
+
+def write_index(parser, path=None):
+    "Build the index for `parser` and store it at `path`."
+    store(build_stored_index(parser), path or index_path())
+
+
+def load_index(parser, path=None):
+    """Load the index at `path`. If it's missing, or any of the files it was
+    built from have changed since, build it from `parser` and try to store it
+    for next time.
+    """
+    path = path or index_path()
+    try:
+        with open(path) as f:
+            index = json.load(f)
+        if not stale(index):
+            return index
+    except (IOError, OSError, ValueError):
+        pass
+    index = build_stored_index(parser)
+    try:
+        store(index, path)
+    except (IOError, OSError):
+        pass
+    return index
+
+
+def complete(index, words, descriptions=False):
+    """Given an index and the words typed so far (the last of which is the
+    one being completed, and may be empty), return the possible completions
+    of the last word. If `descriptions`, return (completion, description)
+    pairs instead.
+    """
+    node = index
+    # follow any subcommands that have been typed.
+    for word in words[:-1]:
+        if word in node["subcommands"]:
+            node = node["subcommands"][word]
+    prefix = words[-1] if words else ""
+    # complete flags if this looks like one, and subcommands otherwise.
+    if prefix.startswith("-"):
+        candidates = [(name, description) for names, description
+            in node["flags"] for name in names]
+    else:
+        candidates = [(name, subcommand["description"]) for name, subcommand
+            in node["subcommands"].items()]
+    candidates = sorted(c for c in candidates if c[0].startswith(prefix))
+    if descriptions:
+        return candidates
+    return [name for name, _ in candidates]
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+""" Converting command-line strings to the types functions expect. """
+
+try:
+    string_types = (str, unicode)
+    integer_types = (int, long)
+except NameError:
+    string_types = (str,)
+    integer_types = (int,)
+
+
+def boolean(string):
+    "Convert a string like 'yes' or 'false' to a bool."
+    lowered = string.lower()
+    if lowered in ("1", "true", "t", "yes", "y", "on"):
+        return True
+    elif lowered in ("0", "false", "f", "no", "n", "off"):
+        return False
+    raise ValueError("not a boolean: %r" % string)
+
+
+def usable_type(annotation):
+    """Given an annotation, return the type values should be converted to,
+    or None if there's no way to convert to it. Classes and other callables
+    are used as they are; `Optional[X]` and `X | None` mean X, since a value
+    given on the command line is never None; other things from `typing`,
+    like `List[str]`, can't be called on a string, and so are ignored.
+    """
+    if annotation is None:
+        return None
+    elif "typing" in (type(annotation).__module__,
+            getattr(annotation, "__module__", None)) \
+            or type(annotation).__module__ == "types":
+        origin = getattr(annotation, "__origin__", None)
+        args = [a for a in getattr(annotation, "__args__", None) or ()
+                if a is not type(None)]
+        if (origin is None or repr(origin) == "typing.Union") \
+                and len(args) == 1:
+            return usable_type(args[0])
+        return None
+    return annotation if callable(annotation) else None
+
+
+def inferred_type(default):
+    """Given a default value, return the type values should be converted to,
+    or None to leave them as strings. Only scalars -- strings, numbers, bools
+    and paths -- say anything about what a value on the command line means;
+    a default of `[]` doesn't mean "abc" should become a list of letters.
+    """
+    if isinstance(default, string_types + integer_types + (float, bool)) \
+            or hasattr(default, "__fspath__"):
+        return default.__class__
+    return None
+
+
+def converter_for(type):
+    """Given a type, return a function that converts a command-line string to
+    it, or None if strings are fine as they are. Any type that can be made
+    from a string -- int, float, Decimal, pathlib.Path and so on -- is its
+    own converter.
+    """
+    if type is None or type in string_types:
+        return None
+    elif type is bool:
+        return boolean
+    return type
+
+
+def bulk_converter_for(type):
+    """Like `converter_for`, but return a function that converts a whole
+    sequence of strings at once, into a tuple, which is what `*args` becomes
+    anyway.
+    """
+    convert = converter_for(type)
+    if convert is None:
+        return None
+    return lambda values: tuple(map(convert, values))
+
+
+def type_name(type):
+    "Determine a readable name for `type`, for error messages."
+    return getattr(type, "__name__", repr(type))
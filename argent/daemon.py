@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+""" Daemon mode: a long-lived process that holds a fully built parser tree and
+runs command lines sent to it over a Unix socket by `argent.client`, so that
+they don't pay for starting Python and importing everything each time.
+
+Each command line runs in a forked child, in the client's working directory
+and environment, with Python's `sys.stdin`, `sys.stdout` and `sys.stderr`
+connected to the client's. The server shuts itself down after it's been idle
+for a while, and restarts itself when any of its source files change. Its
+socket is in a directory only its user can get into, and both ends check
+that the other is running as the same user before anything is sent.
+"""
+
+import io
+import json
+import os
+import socket
+import sys
+import time
+import traceback
+
+from argent.client import (receive_frame, send_frame, socket_path, trusted,
+        STDIN, STDOUT, STDERR, RESULT, EXIT)
+from argent.parser import LazySubparser
+
+
+class FrameReader(io.RawIOBase):
+    "Read what the client forwards from its stdin."
+    def __init__(self, sock):
+        self.sock = sock
+        self.pending = b""
+        self.finished = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.pending and not self.finished:
+            channel, data = receive_frame(self.sock)
+            if channel == STDIN:
+                self.pending = data
+                self.finished = not data
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+
+class FrameWriter(io.RawIOBase):
+    "Send whatever is written to the client, on `channel`."
+    def __init__(self, sock, channel):
+        self.sock = sock
+        self.channel = channel
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        data = memoryview(b).tobytes()
+        if data:
+            send_frame(self.sock, self.channel, data)
+        return len(data)
+
+
+def _text(raw, buffered, encoding):
+    # python 2's sys.std* deal in byte strings; python 3's in text.
+    if sys.version_info[0] < 3:
+        return buffered(raw)
+    return io.TextIOWrapper(buffered(raw), encoding=encoding,
+            line_buffering=False)
+
+
+def handle(parser, sock):
+    """Run the command line the client at the other end of `sock` sent on
+    `parser`, and return the exit code.
+    """
+    request = json.loads(receive_frame(sock)[1].decode("utf-8"))
+    os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+    # `argv` is shared with argent.parser, so replace its contents.
+    sys.argv[:] = request["argv"]
+    encoding = "utf-8"
+    sys.stdin = _text(FrameReader(sock), io.BufferedReader, encoding)
+    sys.stdout = _text(FrameWriter(sock, STDOUT), io.BufferedWriter, encoding)
+    sys.stderr = _text(FrameWriter(sock, STDERR), io.BufferedWriter, encoding)
+    code, result = 0, None
+    try:
+        result = parser.command_line()
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            code = e.code or 0
+        else:
+            sys.stderr.write("%s\n" % (e.code,))
+            code = 1
+    except Exception:
+        traceback.print_exc()
+        code = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    # send the return value along, as JSON if it can be.
+    try:
+        encoded = json.dumps(result)
+    except (TypeError, ValueError):
+        encoded = json.dumps(repr(result))
+    send_frame(sock, RESULT, encoded.encode("utf-8"))
+    send_frame(sock, EXIT, str(code).encode("ascii"))
+    return code
+
+
+def resolve_all(parser):
+    "Import every lazy subparser in the tree under `parser`."
+    for subparser in list(parser.subparsers.values()):
+        if isinstance(subparser, LazySubparser):
+            subparser = subparser.resolve()
+        resolve_all(subparser)
+
+
+def source_files():
+    """Find the modification times of the source files of everything that's
+    been imported, and of the program itself.
+    """
+    paths = [sys.argv[0]] + [getattr(m, "__file__", None)
+        for m in list(sys.modules.values())]
+    mtimes = {}
+    for path in paths:
+        if not path:
+            continue
+        # watch the source, rather than its bytecode.
+        if path.endswith((".pyc", ".pyo")):
+            path = path[:-1]
+        try:
+            mtimes[path] = os.path.getmtime(path)
+        except OSError:
+            pass
+    return mtimes
+
+
+def changed(mtimes):
+    "Determine whether any of the files in `mtimes` have been modified."
+    for path, mtime in mtimes.items():
+        try:
+            if os.path.getmtime(path) != mtime:
+                return True
+        except OSError:
+            return True
+    return False
+
+
+def serve(parser, path=None, idle_timeout=15 * 60, watch=True, poll=1.0):
+    """Serve `parser` on the Unix socket at `path` until nobody has connected
+    for `idle_timeout` seconds. If `watch`, re-execute this program when any
+    of its source files change.
+    """
+    path = path or socket_path(sys.argv[0])
+    resolve_all(parser)
+    mtimes = source_files() if watch else {}
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # the socket is only put in place once it's listening, so that clients
+    # never find it before they can connect to it.
+    temporary = "%s.%d" % (path, os.getpid())
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    sock.bind(temporary)
+    sock.listen(64)
+    os.rename(temporary, path)
+    sock.settimeout(poll)
+    children = set()
+    last = time.time()
+    restart = False
+    try:
+        while True:
+            # reap any children that have finished.
+            for pid in list(children):
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    children.discard(pid)
+            try:
+                connection = sock.accept()[0]
+            except socket.timeout:
+                if watch and changed(mtimes):
+                    restart = True
+                    break
+                if idle_timeout and not children \
+                        and time.time() - last > idle_timeout:
+                    break
+                continue
+            # only run command lines from the user we're running as.
+            if not trusted(connection):
+                connection.close()
+                continue
+            last = time.time()
+            pid = os.fork()
+            if pid == 0:
+                sock.close()
+                connection.settimeout(None)
+                code = 1
+                try:
+                    code = handle(parser, connection)
+                finally:
+                    os._exit(code)
+            children.add(pid)
+            connection.close()
+    finally:
+        sock.close()
+        if os.path.exists(path):
+            os.remove(path)
+    if restart:
+        os.execv(sys.executable, [sys.executable] + sys.argv)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+""" Finding the descriptions and synonyms of arguments in docstrings.
+
+Any line of a docstring that starts with a name and a colon describes the
+argument with that name:
+
+    --f, --flag: a flag; the names before the colon are comma-separated, and
+        the first is the canonical one. Lines indented further than this
+        one carry on its description.
+
+Lines like "Arguments:" with nothing after the colon are headings. If a
+docstring has one of the `HEADINGS` anywhere in it, only the lines in
+sections under those describe arguments, so that the ones under headings like
+"Returns:" or "Example:" don't; otherwise, headings make no difference.
+Docstrings are read a line at a time, in time linear in their length.
+"""
+
+# headings like these introduce a block of descriptions.
+HEADINGS = frozenset(["arguments", "args", "flags", "options", "parameters"])
+
+
+def valid_name(name):
+    "Determine whether `name` looks like the name of an argument or flag."
+    # names are letters, digits, underscores and dashes; `*args` may be
+    # written with its star.
+    return name.lstrip("*").replace("-", "").replace("_", "").isalnum()
+
+
+def heading(line):
+    """If `line` is a heading, return its name in lower case; otherwise
+    return None.
+    """
+    name, colon, rest = line.partition(":")
+    if not colon or rest.strip() or not name.replace(" ", "").isalpha():
+        return None
+    return name.lower()
+
+
+def parse_entry(line):
+    """If `line` describes an argument, return its names and description;
+    otherwise return None.
+    """
+    head, colon, description = line.partition(":")
+    if not colon:
+        return None
+    names = [n.strip() for n in head.split(",")]
+    description = description.strip()
+    # "http://..." is a URL, not a description of `http`.
+    if not description or description.startswith("//"):
+        return None
+    if not all(valid_name(n) for n in names):
+        return None
+    return [n.lstrip("*") for n in names], description
+
+
+def parse_docstring(doc):
+    """Given a docstring, return a dictionary from argument names (with
+    underscores) to descriptions and one from argument names to lists of
+    their synonyms.
+    """
+    # each description is a list of its lines until they're all found, so
+    # that they're only joined once.
+    descriptions = {}
+    synonyms = {}
+    # the name and indentation of the entry being continued, if any.
+    current, indent = None, 0
+    # whether each entry is under one of the HEADINGS, and whether the lines
+    # are now; until there's a heading, they aren't.
+    sections = {}
+    describing = False
+    # if none of the headings are for arguments, every entry counts.
+    headed = False
+    for line in (doc or "").splitlines():
+        stripped = line.strip()
+        if not stripped:
+            # blank lines end descriptions.
+            current = None
+            continue
+        this_indent = len(line) - len(line.lstrip())
+        if current is not None and this_indent > indent:
+            descriptions[current].append(stripped)
+            continue
+        current = None
+        section = heading(stripped)
+        if section is not None:
+            describing = section in HEADINGS
+            headed = headed or describing
+            continue
+        entry = parse_entry(stripped)
+        if entry is None:
+            continue
+        names, description = entry
+        # the first synonym is the canonical name
+        name = names[0].replace("-", "_")
+        descriptions[name] = [description]
+        synonyms[name] = names[1:]
+        sections[name] = describing
+        current, indent = name, this_indent
+    if headed:
+        for name, described in sections.items():
+            if not described:
+                del descriptions[name], synonyms[name]
+    return dict((name, " ".join(lines)) for name, lines
+            in descriptions.items()), synonyms
@@ -2,8 +2,9 @@
 # -*- coding: utf-8 -*-
 
 from os.path import basename
-from sys import argv
-from clint.textui import columns
+import os
+import sys
+from argent import trace
 
 
 def format_list(string, list):
@@ -13,101 +14,202 @@ def format_list(string, list):
     >>> format_list("(%d) ", [1, 2, 3])
     "(1) (2) (3)"
     """
-    total = ""
-    for item in list:
-        total += string % item
-    return total
+    return "".join([string % item for item in list])
 
 
-def parent_list(parser, l):
-    """Given a parser and a list so far, recursively determine the parentage
-    of the parser.
+def parent_list(parser, l, prog=None):
+    """Given a parser and a list so far, determine the parentage of the
+    parser. The program is called `prog`, if that's given.
     """
-    # if the parser doesn't have a parent.
-    if not parser.parent:
-        # and if it was called from the command line
-        if argv[0]:
-            # use the name it was called as from the command line.
-            l.insert(0, basename(argv[0]))
-            return l
-        # otherwise, just insert the parser's name attribute.
-        else:
-            l.insert(0, parser.name)
-            return l
-    # if the parser does have a parent...
+    # walk up to the parser without a parent, adding each name on the way.
+    while parser.parent:
+        l.insert(0, parser.name)
+        parser = parser.parent
+    # if it was called from the command line, use the name it was called as
+    # from the command line; otherwise, use the parser's name attribute.
+    if prog is not None:
+        l.insert(0, prog)
+    elif sys.argv[0]:
+        l.insert(0, basename(sys.argv[0]))
     else:
-        # insert this parser's name
         l.insert(0, parser.name)
-        # and call this function on the parent.
-        return parent_list(parser.parent, l)
+    return l
 
 
-def word_description(words_and_descriptions):
+def terminal_size():
+    """Determine the width and height of the terminal on stdout, falling back
+    to $COLUMNS and $LINES and then to 80x24.
+    """
+    width = height = 0
+    try:
+        import fcntl, struct, termios
+        size = fcntl.ioctl(sys.stdout.fileno(), termios.TIOCGWINSZ,
+                struct.pack("HHHH", 0, 0, 0, 0))
+        height, width = struct.unpack("HHHH", size)[:2]
+    except Exception:
+        pass
+    width = width or int(os.environ.get("COLUMNS", 0)) or 80
+    height = height or int(os.environ.get("LINES", 0)) or 24
+    return width, height
+
+
+def wrap(text, width):
+    """Break `text` into lines of at most `width` characters: at its own line
+    breaks, and then between words, splitting any word that's too long. This
+    is how clint's columns wrap text.
+    """
+    lines = []
+    for paragraph in text.replace("\r", "\n").split("\n"):
+        line = ""
+        for word in paragraph.split():
+            if len(line) + len(word) <= width:
+                line += word + " "
+                continue
+            if line:
+                lines.append(line.rstrip())
+            # a word too long for any line is cut into pieces that fit.
+            while len(word) > width:
+                lines.append(word[:width])
+                word = word[width:]
+            line = word + " "
+        lines.append(line.rstrip())
+    return lines
+
+
+def word_description(words_and_descriptions, width=80):
     """Given a list of two-tuples, the first item being a word and the second
     being a description of that word, return a neatly-formatted string with
     the words and descriptions in columns.
     """
-    lines = []
+    # the description gets whatever the indent and the word column don't.
+    description_width = max(width - 15, 20)
+    rows = []
     for word, description in words_and_descriptions:
-        lines.append(columns([" ", 2], [word, 13], [description, 65]))
-    return "\n".join(lines)
+        words = wrap(str(word), 13)
+        descriptions = wrap(str(description), description_width)
+        # every column is padded out to its width, and as many lines as
+        # the longest one.
+        for i in range(max(len(words), len(descriptions))):
+            rows.append("   %s %s " % (
+                (words[i] if i < len(words) else "").ljust(13),
+                (descriptions[i] if i < len(descriptions) else "").ljust(
+                    description_width)))
+    return "\n".join(rows)
 
 
 class HelpFormatter(object):
-    "A class for formatting help messages, given an argent.Parser instance."
+    """A class for formatting help messages, given an argent.Parser instance.
+    Rendered messages are kept on the parser, one for each terminal width,
+    until its flags, arguments or subparsers change.
+    """
+    __slots__ = ("parser",)
+
     def __init__(self, parser):
         self.parser = parser
 
-    def usage(self):
-        "Print a helpful message regarding the usage of this program."
+    def format_usage(self, prog=None):
+        """Format a helpful message regarding the usage of this program, which
+        is called `prog` (by default, whatever it was run as).
+        """
         # determine the start of the usage string...
-        usage = "usage: %s " % " ".join(parent_list(self.parser, []))
+        usage = "usage: %s " % " ".join(parent_list(self.parser, [], prog))
         # list all of the flags, optional args, and necessary args.
-        usage += format_list("[%s] ",
+        return (usage + format_list("[%s] ",
                 [f.name for f in self.parser.flags])
-        usage += format_list("%s ",
+            + format_list("%s ",
                 [f.name for f in self.parser.necessary_args])
-        usage += format_list("[%s] ",
+            + format_list("[%s] ",
                 [f.name for f in self.parser.optional_args])
-        print(usage)
+            + format_list("[%s ...] ",
+                [f.name for f in self.variadic()]))
+
+    def format_subcommands(self, width=80):
+        return "Subcommands:\n" + word_description([(n, f.description)
+            for n, f in self.parser.subparsers.items()], width)
+
+    def format_flags(self, width=80):
+        return "optional flags:\n" + word_description([
+            (", ".join(f.synonym_names), f.description)
+            for f in self.parser.flags], width)
+
+    def variadic(self):
+        "Return a list of the argument that takes `*args`, if there is one."
+        variadic = getattr(self.parser, "variadic", None)
+        return [variadic] if variadic is not None else []
+
+    def format_optional(self, width=80):
+        return "optional arguments:\n" + word_description(
+                [(f.name, f.description) for f
+                    in self.parser.optional_args + self.variadic()], width)
+
+    def format_necessary(self, width=80):
+        return "necessary arguments:\n" + word_description(
+                [(f.name, f.description) for f in self.parser.necessary_args],
+                width)
+
+    def format(self, width=80, prog=None):
+        "Create a help message for `self.parser`."
+        sections = [self.format_usage(prog), "", self.parser.description]
+        # if there are any flags, list them.
+        if self.parser.flags:
+            sections += ["", self.format_flags(width)]
+        # if there are any subparsers, list them.
+        if self.parser.subparsers:
+            sections += ["", self.format_subcommands(width)]
+        # list necessary and optional arguments, if there are any.
+        if self.parser.necessary_args:
+            sections += ["", self.format_necessary(width)]
+        if self.parser.optional_args or self.variadic():
+            sections += ["", self.format_optional(width)]
+        return "\n".join(sections) + "\n"
+
+    def render(self, width=None, prog=None):
+        """Return the help message for `self.parser` at the given width (by
+        default, the terminal's) and program name (by default, what it was
+        run as), formatting it only if it hasn't been yet.
+        """
+        if width is None:
+            width = terminal_size()[0]
+        # the message depends on the program's name, too.
+        key = (sys.argv[0] if prog is None else None, prog, width)
+        # (threads may race to make these, but they'd all make the same.)
+        cache = self.parser._help_cache
+        if cache is None:
+            cache = self.parser._help_cache = {}
+        rendered = cache.get(key)
+        if rendered is None:
+            rendered = cache[key] = self.format(width, prog)
+        return rendered
+
+    # these print individual parts of the help message.
+    def usage(self):
+        "Print a helpful message regarding the usage of this program."
+        sys.stdout.write(self.format_usage() + "\n")
 
     def print_subcommands(self):
-        print("Subcommands:")
-        print word_description([(n, f.description) for n, f
-            in self.parser.subparsers.items()])
+        sys.stdout.write(self.format_subcommands() + "\n")
 
     def print_flags(self):
-        print("optional flags:")
-        print word_description([(", ".join(f.synonym_names), f.description) for
-            f in self.parser.flags])
+        sys.stdout.write(self.format_flags() + "\n")
 
     def print_optional(self):
-        print("optional arguments:")
-        print word_description(
-                [(f.name, f.description) for f in self.parser.optional_args])
+        sys.stdout.write(self.format_optional() + "\n")
 
     def print_necessary(self):
-        print("necessary arguments:")
-        print word_description(
-                [(f.name, f.description) for f in self.parser.necessary_args])
+        sys.stdout.write(self.format_necessary() + "\n")
 
     def __call__(self):
         "Create and print a help message for `self.parser`."
-        self.usage()
-        print("")
-        print(self.parser.description)
-        # if there are any flags, list them.
-        if self.parser.flags:
-            print("")
-            self.print_flags()
-        # if there are any subparsers, list them.
-        if self.parser.subparsers:
-            print("")
-            self.print_subcommands()
-        # print necessary and optional arguments, if there are any.
-        if self.parser.necessary_args:
-            print("")
-            self.print_necessary()
-        if self.parser.optional_args:
-            print("")
-            self.print_optional()
+        if trace.active:
+            start = trace.clock()
+        width, height = terminal_size()
+        message = self.render(width)
+        if trace.active:
+            trace.emit("help", start, lines=message.count("\n"))
+        # page messages too long to fit on the terminal.
+        if sys.stdout.isatty() and message.count("\n") >= height:
+            import pydoc
+            pydoc.pager(message)
+        else:
+            sys.stdout.write(message)
+            sys.stdout.flush()
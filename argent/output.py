@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+""" Writing what commands return to stdout, as plain text, JSON or JSON lines.
+Generators and other iterators are written an item at a time as they're
+produced, in large writes, so commands can yield any number of results
+without building a list of them first. """
+
+import errno
+import json
+import os
+import sys
+
+FORMATS = ("plain", "json", "jsonl")
+
+
+def _default(obj):
+    # arrays, sets and other iterables become lists; anything else, strings.
+    try:
+        return list(obj)
+    except TypeError:
+        return str(obj)
+
+
+def _dumps(obj):
+    return json.dumps(obj, default=_default)
+
+
+def is_stream(value):
+    "Determine whether `value` is an iterator, to be written item by item."
+    return hasattr(value, "__next__") or hasattr(value, "next")
+
+
+def render(value, format):
+    "Yield the pieces of text `value` is written as in `format`."
+    if format not in FORMATS:
+        raise ValueError("Unknown output format: %r" % (format,))
+    if value is None:
+        return
+    if format == "json":
+        if not is_stream(value):
+            yield _dumps(value) + "\n"
+            return
+        # write a stream as a JSON list, without having it all at once.
+        separator = "["
+        for item in value:
+            yield separator + _dumps(item)
+            separator = ","
+        yield "[]\n" if separator == "[" else "]\n"
+        return
+    # plain text and JSON lines are both a line per item.
+    line = _dumps if format == "jsonl" else str
+    if is_stream(value) or isinstance(value, (list, tuple)):
+        for item in value:
+            yield line(item) + "\n"
+    else:
+        yield line(value) + "\n"
+
+
+def emit(value, format="plain", stream=None, buffer_size=64 * 1024):
+    """Write `value` to `stream` (by default, stdout) in `format`. Return False
+    if the reader went away before it was all written, and True otherwise.
+    """
+    stream = stream or sys.stdout
+    pending, size = [], 0
+    try:
+        for piece in render(value, format):
+            pending.append(piece)
+            size += len(piece)
+            if size >= buffer_size:
+                stream.write("".join(pending))
+                pending, size = [], 0
+        stream.write("".join(pending))
+        stream.flush()
+    except (IOError, OSError) as e:
+        if e.errno != errno.EPIPE:
+            raise
+        # let a generator clean up after itself,
+        if hasattr(value, "close"):
+            value.close()
+        # and keep python from complaining when it flushes stdout at exit.
+        try:
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, stream.fileno())
+        except (AttributeError, ValueError, OSError):
+            pass
+        return False
+    return True
@@ -1,9 +1,60 @@
 # -*- coding: utf-8 -*-
 
+import sys
 from sys import argv
-from argent.help import HelpFormatter
-from argent.arguments import arguments_from_function, help_arg
 from itertools import chain
+from argent.arguments import arguments_from_function, help_arg, no_cache_arg
+from argent.conversion import string_types, type_name
+from argent.streams import Stream, reopen
+from argent import trace
+try:
+    from _thread import allocate_lock, get_ident
+except ImportError:
+    from thread import allocate_lock, get_ident
+
+
+# the event loops coroutine commands are run on, by thread; see
+# `run_coroutine`.
+_loops = {}
+
+# lazy subparsers are resolved while holding this, so that threads sharing a
+# parser tree import and build each of them only once.
+_resolving = allocate_lock()
+
+# this separates the stages of a pipeline on the command line.
+PIPE = "--"
+
+# the flag on code objects of `async def` functions.
+CO_COROUTINE = 0x80
+
+
+def iscoroutinefunction(fn):
+    "Determine whether `fn` is an `async def` function."
+    code = getattr(fn, "__code__", None)
+    if code is not None:
+        # this is what inspect checks, without the cost of importing it.
+        return bool(code.co_flags & CO_COROUTINE)
+    try:
+        from inspect import iscoroutinefunction
+    except ImportError:
+        # there aren't any before python 3.5.
+        return False
+    return iscoroutinefunction(fn)
+
+
+def run_coroutine(coroutine):
+    """Run `coroutine` to completion and return its result. Every coroutine
+    run by a thread is run on the same event loop, so that commands can share
+    connections and the like between calls in the same process; threads
+    each get their own, since a loop can only run in one at once.
+    """
+    import asyncio
+    loop = _loops.get(get_ident())
+    if loop is None or loop.is_closed():
+        import atexit
+        loop = _loops[get_ident()] = asyncio.new_event_loop()
+        atexit.register(loop.close)
+    return loop.run_until_complete(coroutine)
 
 
 def nothing(*args, **kwargs):
@@ -13,25 +64,77 @@ def nothing(*args, **kwargs):
     pass
 
 
+# most parsers only take the help flag, so they all share these tables for it.
+_help_table = dict((name, help_arg) for name in help_arg.synonym_names)
+_no_flag_defaults = {}
+
+
 class Parser(object):
     """A parser for command-line flags and arguments."""
-    def __init__(self, function=nothing, help=HelpFormatter):
+    # there can be a great many parsers in a big program, so they don't each
+    # get a __dict__.
+    __slots__ = ("subparsers", "function", "coroutine", "parent", "_help",
+            "_help_type", "variadic", "signature", "_flags", "_args", "name",
+            "description", "output", "cache", "pipeline",
+            "response_file_prefix", "_flag_table", "_flag_defaults", "_slots",
+            "_min_args", "_streams", "_help_cache", "_suggestions")
+
+    def __init__(self, function=nothing, help=None, output=None,
+            cache=None, response_file_prefix=None):
         # a dictionary of subparsers;
         # the keys are their names, the values are the actual objects.
         self.subparsers = {}
         # this is the function that will get all of the arguments passed
         # to the parser.
         self.function = function
+        # if it's a coroutine function, it has to be run on an event loop.
+        self.coroutine = iscoroutinefunction(function)
         # presumably, a parser created this way is _not_ a subparser.
         self.parent = None
-        # and these are the flags that it can take
-        self.flags = []
-        # this is the formatter that the parser will use for its help:
-        self.help = help(self)
+        # this is the formatter class that the parser will use for its help;
+        # None means `argent.help.HelpFormatter`. the formatter itself is
+        # only made (and its module imported) when it's needed; see `help`.
+        self._help_type = help
+        self._help = None
+        # this is the argument that takes any extra positional arguments,
+        # if the function has `*args`.
+        self.variadic = None
+        # and this is the order the function takes its arguments in, which
+        # is needed to pass them positionally along with `*args`.
+        self.signature = ()
+        # arguments starting with this (like "@") name response files to
+        # read more arguments from. they're off unless it's set, since
+        # otherwise any value starting with it would be read as a path.
+        self.response_file_prefix = response_file_prefix
+        # `command_line` writes what the function returns to stdout in this
+        # format -- "plain", "json" or "jsonl" -- if it's set. generators are
+        # written as they go.
+        self.output = output
+        # the stages of pipelines given to this parser run one after another
+        # in this thread if this is None, or else each in its own "threads"
+        # or "processes"; see argent.pipeline.
+        self.pipeline = None
+        # an `argent.cache.ResultCache` to keep what the function returns in,
+        # for functions that always return the same thing for the same
+        # arguments; True means one in the default place.
+        if cache is True:
+            from argent.cache import ResultCache
+            cache = ResultCache()
+        self.cache = cache
+        # and these are the flags and arguments that it can take;
+        # assigning them compiles the parser's dispatch tables.
+        self._flags = []
+        self.args = []
+
+    # these add and remove hooks for timing events; see `argent.trace`.
+    add_hook = staticmethod(trace.add_hook)
+    remove_hook = staticmethod(trace.remove_hook)
 
     @classmethod
     def from_function(cls, fn, **kwargs):
         """Create a parser from a function. This could also be a decorator."""
+        if trace.active:
+            start = trace.clock()
         parser = cls(fn, **kwargs)
         # figure out the parser's name.
         parser.name = fn.__name__
@@ -42,82 +145,630 @@ class Parser(object):
             parser.description = ""
         # get the arguments the function expects
         args = arguments_from_function(fn)
-        # flags are the ones that start with an underscore:
-        parser.flags = [a for a in args if a.flag]
+        if args[-1].variadic:
+            parser.variadic = args.pop()
+        parser.signature = tuple(a.underscored for a in args
+                if a is not help_arg)
+        # flags are the ones that start with an underscore,
+        flags = [a for a in args if a.flag]
+        # plus a way around the cache, if there is one.
+        if parser.cache is not None:
+            flags.append(no_cache_arg)
+        parser.flags = flags
         # arguments are the ones that don't.
         parser.args = [a for a in args if not a.flag]
-        # determine which arguments are necessary and which aren't.
-        parser.necessary_args = [a for a in parser.args if a.necessary]
-        parser.optional_args = [a for a in parser.args if not a.necessary]
+        if trace.active:
+            trace.emit("construct", start, parser=parser.name,
+                    flags=len(parser.flags), args=len(parser.args))
         # return the parser...
         return parser
 
-    def subparse(self, fn):
+    def subparse(self, fn=None, **kwargs):
         """A decorator that creates a new subparser in self.subparsers
-        from the decorated function.
+        from the decorated function. Given only keyword arguments, like
+        `@parser.subparse(cache=True)`, it returns a decorator that passes
+        them on to the new Parser.
         """
+        if fn is None:
+            return lambda fn: self.subparse(fn, **kwargs)
         # create a parser from this function
-        # with its parent's help formatter class
-        subparser = Parser.from_function(fn, help=type(self.help))
+        # with its parent's help formatter class and output format
+        # (results aren't cached unless asked for, though).
+        kwargs.setdefault("help", self._help_type)
+        kwargs.setdefault("output", self.output)
+        subparser = Parser.from_function(fn, **kwargs)
         # set the subparser's `parent` attribute to this parser.
         subparser.parent = self
         # add it to the `subparsers` dictionary.
         self.subparsers[subparser.name] = subparser
+        self.compile()
         # add this parser's help to it.
         # return the Parser object for the subparser.
         return subparser
 
+    def subparse_lazy(self, reference, name=None, description=None):
+        """Register a subparser by a "module:function" reference without
+        importing it. The module is only imported when this subcommand is
+        actually parsed, or when something needs to know more about it than
+        `name` and `description`.
+        """
+        # by default, the subcommand is named after the function.
+        if name is None:
+            name = reference.rpartition(":")[2].rpartition(".")[2]
+        subparser = LazySubparser(self, name, reference, description)
+        self.subparsers[name] = subparser
+        self.compile()
+        return subparser
+
+    def parse_many(self, command_lines, processes=None):
+        """Parse each of an iterable of command lines -- either strings, which
+        are split like a shell would, or lists of arguments -- in this one
+        process, or in a pool of `processes` worker processes. Yield an
+        `argent.batch.Outcome` for each of them, in order; an error in one
+        doesn't stop the rest.
+        """
+        from argent.batch import parse_many
+        return parse_many(self, command_lines, processes)
+
+    @property
+    def help(self):
+        "The formatter for this parser's help messages."
+        if self._help is None:
+            if self._help_type is None:
+                from argent.help import HelpFormatter
+                self._help_type = HelpFormatter
+            self._help = self._help_type(self)
+        return self._help
+
+    @help.setter
+    def help(self, formatter):
+        self._help = formatter
+        self._help_type = type(formatter)
+
+    def validate(self, command_line):
+        """Check a command line -- a string, which is split like a shell
+        would, or a list of arguments -- without running anything, and
+        return a list of `argent.validation.Diagnostic`s for its problems.
+        """
+        from argent.validation import validate
+        return validate(self, command_line)
+
+    def validate_many(self, command_lines):
+        """Check each of an iterable of command lines, yielding a list of
+        diagnostics for each of them in order.
+        """
+        from argent.validation import validate_many
+        return validate_many(self, command_lines)
+
+    @property
+    def flags(self):
+        "The flags this parser accepts."
+        return self._flags
+
+    @flags.setter
+    def flags(self, flags):
+        self._flags = flags
+        self.compile()
+
+    @property
+    def args(self):
+        "The positional arguments this parser accepts, in order."
+        return self._args
+
+    @args.setter
+    def args(self, args):
+        self._args = args
+        self.compile()
+
+    def compile(self):
+        """Precompute the tables that `run` uses to classify its arguments.
+        This happens whenever `flags` or `args` are assigned or a subparser
+        is added; if you change any of them in place, call this again
+        afterwards.
+        """
+        if len(self._flags) == 1 and self._flags[0] is help_arg:
+            self._flag_table = _help_table
+            self._flag_defaults = _no_flag_defaults
+        else:
+            # map every name a flag can be given as to the flag itself.
+            self._flag_table = dict((name, f) for f in self._flags
+                    for name in f.synonym_names)
+            # every flag starts out False; `run` copies this and fills it in.
+            self._flag_defaults = dict((f.underscored, False) for f
+                    in self._flags if f is not help_arg
+                    and f is not no_cache_arg)
+        # positional arguments fill these keyword slots in order, each with
+        # its converter and the name to use in errors.
+        self._slots = tuple((a.underscored, a.converter, a.name)
+                for a in self._args)
+        self._min_args = len([a for a in self._args if a.necessary])
+        # stream arguments that aren't given read from stdin instead.
+        self._streams = tuple((i, a.underscored, a.type) for i, a
+                in enumerate(self._args) if isinstance(a.type, Stream))
+        # rendered help messages, by program name and terminal width; this
+        # is made when it's first needed.
+        self._help_cache = None
+        # and so are these indexes of names to suggest when there's a typo.
+        self._suggestions = None
+
+    def suggest(self, word):
+        """Return the flags (if `word` starts with a dash) or subcommands that
+        `word` might be a typo of.
+        """
+        from argent import suggestions
+        if self._suggestions is None:
+            self._suggestions = (suggestions.Index(self._flag_table),
+                    suggestions.Index(self.subparsers))
+        flags, subcommands = self._suggestions
+        return suggestions.suggest(flags if word.startswith("-")
+                else subcommands, word)
+
+    def _error(self, message, word=None, suggestions=None):
+        """Make an error, suggesting what `word` might have been meant to be;
+        those are looked for unless they're given as `suggestions`.
+        """
+        if word is not None:
+            from argent.suggestions import did_you_mean
+            if suggestions is None:
+                suggestions = self.suggest(word)
+            message = "%s: '%s'.%s" % (message, word,
+                    did_you_mean(suggestions))
+        return NameError(message)
+
+    @property
+    def necessary_args(self):
+        "The arguments that have to be given."
+        return [a for a in self._args if a.necessary]
+
+    @property
+    def optional_args(self):
+        "The arguments that have defaults."
+        return [a for a in self._args if not a.necessary]
+
+    def expand(self, arguments):
+        """Lazily expand any response files in some command-line arguments,
+        if they're turned on.
+        """
+        if not self.response_file_prefix:
+            return arguments
+        from argent.response_files import expand
+        return expand(arguments, self.response_file_prefix)
+
+    def dispatch(self, arguments):
+        """Given some command-line arguments, follow the subcommands at the
+        start of them; return the parser that should run and an iterator
+        over the arguments it should run with.
+        """
+        parser = self
+        arguments = iter(arguments)
+        # while the next argument corresponds to a subparser, pass the
+        # rest of the arguments after the subcommand name to it.
+        for argument in arguments:
+            subparser = parser.subparsers.get(argument)
+            if subparser is None:
+                return parser, chain([argument], arguments)
+            if isinstance(subparser, LazySubparser):
+                subparser = subparser.resolve()
+            parser = subparser
+        return parser, arguments
+
     def parse(self, arguments):
         """Given some command-line arguments, decide what to do with them."""
-        # if the first argument corresponds to a subparser....
-        if len(arguments) > 0 and arguments[0] in self.subparsers.keys():
-            subcommand = arguments[0]
-            # pass all of the subcommands after the subcommand name
-            args_to_pass = arguments[1:]
-            # give them to the subparser, to parse
-            return self.subparsers[subcommand].parse(args_to_pass)
-        # otherwise, run self.function with the arguments
-        else:
-            return self.run(arguments)
+        return self._parse(arguments)[1]
+
+    def _parse(self, arguments):
+        "Do what `parse` does; return the parser that ran and its result."
+        # "--" separates the stages of a pipeline (see argent.pipeline), but
+        # the arguments after the first one are only read if there is one.
+        first = FirstStage(self.expand(arguments))
+        if trace.active:
+            return self._parse_traced(first)
+        parser, arguments = self.dispatch(first)
+        bound = parser.bind(arguments)
+        if bound is None:
+            return parser, None
+        if first.piped:
+            from argent.pipeline import run_pipeline
+            return run_pipeline(self, first.rest, self.pipeline,
+                    (parser, bound))
+        return parser, parser.call(*bound)
+
+    def _parse_traced(self, first):
+        "Do what `_parse` does, timing each step of it."
+        start = trace.clock()
+        parser, arguments = self.dispatch(first)
+        # count how far down the tree that went.
+        depth, ancestor = 0, parser
+        while ancestor is not self:
+            depth, ancestor = depth + 1, ancestor.parent
+        trace.emit("dispatch", start, parser=parser.name, depth=depth)
+        counts = {"tokens": 0, "flags": 0}
+        def counted(arguments):
+            for a in arguments:
+                counts["tokens"] += 1
+                counts["flags"] += a.startswith("-")
+                yield a
+        start = trace.clock()
+        bound = parser.bind(counted(arguments))
+        trace.emit("bind", start, parser=parser.name, **counts)
+        if bound is None:
+            return parser, None
+        if first.piped:
+            from argent.pipeline import run_pipeline
+            return run_pipeline(self, first.rest, self.pipeline,
+                    (parser, bound))
+        start = trace.clock()
+        result = parser.call(*bound)
+        trace.emit("call", start, parser=parser.name)
+        return parser, result
+
+    def prepare(self, arguments, prog=None, width=80):
+        """Parse a command line -- a string, which is split like a shell
+        would, or a list of arguments -- without running anything or writing
+        anything out, and return an `Invocation` that can be called to run it
+        (as many times as you like). Help and errors come back on the
+        invocation, rather than being printed or raised; help messages are
+        `width` columns wide and call the program `prog`, or the parser's
+        name if that's None.
+
+        This doesn't change the parser, so any number of threads can prepare
+        command lines with the same one at once. Pipelines can't be prepared;
+        a command line with "--" in it comes back with an error.
+        """
+        if isinstance(arguments, string_types):
+            import shlex
+            arguments = shlex.split(arguments)
+        parser = self
+        try:
+            first = FirstStage(self.expand(arguments))
+            parser, arguments = self.dispatch(first)
+            bound = parser._bind(arguments)
+            if first.piped:
+                raise NameError("Illegal pipeline: pipelines can't be "
+                        "prepared.")
+        except Exception as e:
+            return Invocation(parser, error=e)
+        if bound is None:
+            if prog is None:
+                # the root parser's name, rather than whatever sys.argv says.
+                root = self
+                while root.parent is not None:
+                    root = root.parent
+                prog = getattr(root, "name", "")
+            return Invocation(parser, help=parser.help.render(width, prog))
+        return Invocation(parser, *bound)
+
+    def parse_async(self, arguments):
+        """Like `parse`, but return an awaitable instead of running coroutine
+        functions to completion, for use within an event loop that's already
+        running. Errors in the arguments are raised right away, and so is
+        one for a pipeline, since those can't be run this way.
+        """
+        import asyncio
+        first = FirstStage(self.expand(arguments))
+        parser, arguments = self.dispatch(first)
+        bound = parser.bind(arguments)
+        if first.piped:
+            raise NameError("Illegal pipeline: pipelines can't be run "
+                    "asynchronously.")
+        if bound is None:
+            return asyncio.sleep(0)
+        args, kwargs, fresh = bound
+        if not parser.coroutine:
+            # wrap other results up so they can be awaited all the same.
+            return asyncio.sleep(0, parser.call(args, kwargs, fresh))
+        cache = parser.cache
+        key = cache.key(parser.function, args, kwargs) \
+            if cache is not None else None
+        if key is None:
+            return parser.function(*args, **kwargs)
+        if not fresh:
+            found, result = cache.lookup(key)
+            if found:
+                return asyncio.sleep(0, result)
+        # the result is kept once the coroutine is done.
+        future = asyncio.ensure_future(parser.function(*args, **kwargs))
+        future.add_done_callback(lambda future: future.cancelled()
+                or future.exception() is not None
+                or cache.store(key, future.result()))
+        return future
 
     def run(self, arguments):
         """Given some command-line arguments, run this Parser's function
         on them. Note that this will __not__ call any subparsers.
         """
-        # get flags from arguments -- flags are anything that starts with
-        # a dash ("-").
-        flags = [a for a in arguments if a.startswith("-")]
-        # strip the flags from the arguments list:
-        arguments = [a for a in arguments if not a.startswith("-")]
-        # check that there aren't any flags here that aren't
-        # defined in self.flags; i.e., check that the given flags
-        # is a subset of the possible flags.
-        if not set(chain(
-                    *[f.synonym_names for f in self.flags])) >= set(flags):
-            raise NameError("Illegal flags.")
-        elif help_arg.is_in(flags):
+        bound = self.bind(arguments)
+        if bound is None:
+            return None
+        return self.call(*bound)
+
+    def call(self, args, kwargs, fresh=False):
+        """Call this Parser's function with some arguments, running it to
+        completion if it's a coroutine function. If the parser has a cache,
+        the result comes from there if it can, unless `fresh`.
+        """
+        if self.cache is not None:
+            return self.cache.call(self.function, args, kwargs,
+                    lambda: self._call(args, kwargs), fresh)
+        return self._call(args, kwargs)
+
+    def _call(self, args, kwargs):
+        "Call this Parser's function, with no caching."
+        result = self.function(*args, **kwargs)
+        if self.coroutine:
+            return run_coroutine(result)
+        return result
+
+    def bind(self, arguments, source=None):
+        """Given some command-line arguments, check them and return the
+        positional and keyword arguments to call this Parser's function with,
+        and whether to skip the cache. If they ask for help, show it and
+        return None instead. The first stream argument that isn't given reads
+        from `source`, if that's given, rather than from stdin.
+        """
+        bound = self._bind(arguments, source)
+        if bound is None:
             self.help()
-        # raise an error if there are more arguments given than what
-        # the function expects.
-        elif not len(self.args) >= len(arguments):
-            raise NameError("Illegal arguments")
-        # raise an error if there are fewer arguments than are necessary.
-        elif len(arguments) < len(self.necessary_args):
-            raise NameError("Not enough arguments.")
-        else:
-            # create a dictionary of used flags here, to be passed as kwargs.
-            flag_dict = dict(((f.underscored, f.is_in(flags)) for f
-                in self.flags if f != help_arg))
-            # create a dictionary of possible args to used args here.
-            # NOTE: since zip wants lists to be of equal length, it'll throw
-            # out invalid arguments. We need to check before then!
-            arg_dict = dict(
-                    ((a.underscored, b) for a, b in zip(self.args, arguments)))
-            # call the function with a combined dictionary of args and flags.
-            return self.function(**dict(arg_dict.items() + flag_dict.items()))
+        return bound
+
+    def _bind(self, arguments, source=None):
+        "Do what `bind` does, but without showing help when it's asked for."
+        flags, positional, _ = self._sort(arguments, self._illegal_flag)
+        if help_arg in flags:
+            return None
+        # this one isn't for the function.
+        fresh = no_cache_arg in flags
+        flags.discard(no_cache_arg)
+        problem = self._count_problem(positional)
+        if problem is not None:
+            raise problem[1]
+        # start with every flag off and turn on the ones we were given,
+        kwargs = dict(self._flag_defaults)
+        for f in flags:
+            kwargs[f.underscored] = True
+        # then fill the argument slots with the positional arguments,
+        # converting any that need it.
+        for (slot, convert, name), value in zip(self._slots, positional):
+            if convert is not None:
+                value = self._convert(convert, name, value)
+            kwargs[slot] = value
+        for index, slot, stream in self._streams:
+            if index >= len(positional):
+                kwargs[slot] = stream.open(source)
+                # only one of them gets what's piped in.
+                source = None
+        extra = positional[len(self._slots):]
+        if not extra:
+            return (), kwargs, fresh
+        # anything left over goes to `*args`, which means everything has to
+        # be passed positionally, in the function's order.
+        args = [kwargs[name] for name in self.signature]
+        args.extend(self._convert_extra(extra))
+        return args, {}, fresh
+
+    # these are the rules for making sense of arguments; `_bind` raises the
+    # first problem they find, and argent.validation reports all of them.
+
+    def _sort(self, arguments, unknown):
+        """Sort some arguments (which may be any iterable, and are only gone
+        through once) into a set of flags, a list of positional arguments and
+        a list of the indexes of those. Flags are anything that starts with a
+        dash, and must be in the flag table; `unknown` is called with the
+        index and the name of each one that isn't.
+        """
+        table = self._flag_table
+        flags = set()
+        positional = []
+        positions = []
+        for index, a in enumerate(arguments):
+            # (a dash by itself means stdin, so it's positional.)
+            if a.startswith("-") and a != "-":
+                flag = table.get(a)
+                if flag is None:
+                    unknown(index, a)
+                else:
+                    flags.add(flag)
+            else:
+                positional.append(a)
+                positions.append(index)
+        return flags, positional, positions
+
+    def _illegal_flag(self, index, flag):
+        "Raise the error for an unknown flag."
+        raise self._error("Illegal flags", flag)
+
+    def _count_problem(self, positional):
+        """If there are too many or too few positional arguments, return the
+        kind of problem that is, the error for it and the index among them of
+        the argument it's about (None for the end of them); otherwise, return
+        None.
+        """
+        if len(positional) > len(self._slots) and self.variadic is None:
+            # the first one might have been meant to be a subcommand.
+            suggestions = self.subparsers and self.suggest(positional[0])
+            if suggestions:
+                return ("unknown-subcommand", self._error("Illegal arguments; "
+                        "unknown subcommand", positional[0], suggestions), 0)
+            return ("too-many-arguments", NameError("Illegal arguments"),
+                    len(self._slots))
+        elif len(positional) < self._min_args:
+            return ("too-few-arguments", NameError("Not enough arguments."),
+                    None)
+        return None
+
+    def _convert(self, convert, name, value):
+        "Convert a value for the argument `name`, or raise a ValueError."
+        try:
+            return convert(value)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid value for %s: %r (expected %s)." % (
+                    name, value, type_name(convert)))
+
+    def _convert_extra(self, extra):
+        "Convert the values for `*args`, or raise a ValueError."
+        convert = self.variadic.converter
+        if convert is None:
+            return extra
+        try:
+            return convert(extra)
+        except (TypeError, ValueError, OverflowError) as e:
+            raise ValueError("Invalid value for %s: %s (expected %s)." % (
+                    self.variadic.name, e, type_name(self.variadic.type)))
 
     def command_line(self):
         """Get arguments from `sys.argv` and parse them."""
         # since the first argument is the name of the file, ignore it.
         arguments = argv[1:]
-        return self.parse(arguments)
+        # these hidden subcommands are for shell completion.
+        if arguments and arguments[0] == "__complete":
+            from argent import completion
+            index = completion.load_index(self)
+            words = completion.complete(index, arguments[1:])
+            sys.stdout.write("".join([w + "\n" for w in words]))
+            return None
+        elif arguments and arguments[0] == "__complete-index":
+            from argent import completion
+            completion.write_index(self)
+            return None
+        # this runs a server for argent.client to send command lines to.
+        elif arguments and arguments[0] == "__serve":
+            from argent import daemon
+            return daemon.serve(self)
+        # `--batch [--null] [FILE]` runs a command line from each line of
+        # FILE or stdin, and returns how many of them failed.
+        elif arguments and arguments[0] == "--batch":
+            from argent.batch import run_batch
+            return run_batch(self, arguments[1:])
+        # `--validate [--null] [FILE]` checks them without running them.
+        elif arguments and arguments[0] == "--validate":
+            from argent.validation import run_validate
+            return run_validate(self, arguments[1:])
+        parser, result = self._parse(arguments)
+        # write the result out, if the parser that ran wants it written.
+        if parser.output:
+            from argent.output import emit
+            emit(result, parser.output)
+        return result
+
+
+class FirstStage(object):
+    """An iterator over some arguments up to the first "--", if there is one.
+    Once it's done, `piped` says whether there was, and `rest` is an iterator
+    over the arguments after it.
+    """
+    __slots__ = ("rest", "piped")
+
+    def __init__(self, arguments):
+        self.rest = iter(arguments)
+        self.piped = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.piped:
+            raise StopIteration
+        argument = next(self.rest)
+        if argument == PIPE:
+            self.piped = True
+            raise StopIteration
+        return argument
+
+    next = __next__
+
+
+class Invocation(object):
+    """A command line that's been parsed by `Parser.prepare`: the parser that
+    should run it and what to call that parser's function with. Calling the
+    invocation runs it. If the command line asked for help, `help` is the
+    message, and that's what calling it returns; if the command line was
+    wrong, `error` is the exception, and calling it raises that.
+    """
+    __slots__ = ("parser", "args", "kwargs", "fresh", "help", "error")
+
+    def __init__(self, parser, args=(), kwargs=None, fresh=False, help=None,
+            error=None):
+        self.parser = parser
+        self.args = args
+        self.kwargs = kwargs or {}
+        # whether to skip the parser's cache.
+        self.fresh = fresh
+        self.help = help
+        self.error = error
+
+    def __call__(self):
+        "Run the command line and return what the function returns."
+        if self.error is not None:
+            raise self.error
+        elif self.help is not None:
+            return self.help
+        args, kwargs = self.args, self.kwargs
+        # every run reads its streams from the start.
+        if self.parser._streams:
+            args = [reopen(a) for a in args]
+            kwargs = dict((k, reopen(v)) for k, v in kwargs.items())
+        return self.parser.call(args, kwargs, self.fresh)
+
+
+class LazySubparser(object):
+    """A stand-in for a subparser that hasn't been imported yet. It replaces
+    itself in its parent's `subparsers` with the real thing the first time
+    it's needed.
+    """
+    __slots__ = ("parent", "name", "reference", "_description", "_resolved")
+
+    def __init__(self, parent, name, reference, description=None):
+        self.parent = parent
+        self.name = name
+        # this is a "module:function" string.
+        self.reference = reference
+        # this can be given up front so listing subcommands doesn't import.
+        self._description = description
+        self._resolved = None
+
+    def resolve(self):
+        """Import the function this refers to, build its parser and put it
+        in place of this object.
+        """
+        # only do this once, however many references there are to us.
+        if self._resolved is not None:
+            return self._resolved
+        with _resolving:
+            # another thread may have done it while we waited.
+            if self._resolved is None:
+                self._resolved = self._load()
+        return self._resolved
+
+    def _load(self):
+        "Import the function this refers to and build its parser."
+        from importlib import import_module
+        module, _, attribute = self.reference.partition(":")
+        target = import_module(module)
+        for part in attribute.split("."):
+            target = getattr(target, part)
+        # the target may already be a parser; otherwise make one from it
+        # with its parent's help formatter class.
+        if isinstance(target, Parser):
+            subparser = target
+        else:
+            subparser = Parser.from_function(target,
+                    help=self.parent._help_type, output=self.parent.output)
+        subparser.parent = self.parent
+        subparser.name = self.name
+        self.parent.subparsers[self.name] = subparser
+        return subparser
+
+    @property
+    def description(self):
+        "The description we were given, or else the real parser's."
+        if self._description is None:
+            return self.resolve().description
+        return self._description
+
+    def parse(self, arguments):
+        "Import the real subparser and have it parse `arguments`."
+        return self.resolve().parse(arguments)
+
+    def __getattr__(self, attribute):
+        # anything else has to come from the real subparser.
+        return getattr(self.resolve(), attribute)
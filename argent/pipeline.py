@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+""" Chaining subcommands together. A command line like
+
+    tool extract x -- filter --y -- load z
+
+is a pipeline of three stages, separated by "--". Each stage is dispatched
+through the parser's subparsers like any other command line, and what each
+one returns is read by the next through its first stream argument that
+isn't given on the command line (see argent.streams), as an iterator of the
+items it returned, without ever being written out as text.
+
+By default the stages run one after another in one thread, and generators
+are pulled through all of them an item at a time. With the parser's
+`pipeline` set to "threads" or "processes", every stage but the last runs in
+its own thread or process instead, handing its results on through a bounded
+queue, so that a stage that gets ahead of the next one waits for it. Once
+the last stage is done, or fails, the others are stopped, whether or not
+they've finished.
+"""
+
+import pickle
+try:
+    from queue import Empty, Full
+except ImportError:
+    from Queue import Empty, Full
+
+from argent.conversion import string_types
+from argent.parser import PIPE
+from argent.streams import Reader
+
+# the ways the stages of a pipeline can be run.
+MODES = (None, "threads", "processes")
+
+# results go between stages that run at once in batches of this many, since
+# every trip through a queue has a cost,
+BATCH_SIZE = 256
+# and at most this many batches wait for the next stage before the one making
+# them has to wait, too.
+QUEUE_SIZE = 16
+# a stage waiting on a queue checks this often (in seconds) whether the
+# pipeline has stopped,
+POLL_INTERVAL = 0.05
+# and once it has, the stages get this long to notice before any that are
+# processes are terminated.
+JOIN_TIMEOUT = 1.0
+
+
+def stages(arguments):
+    "Split a list of arguments into the stages of a pipeline."
+    stage = []
+    for argument in arguments:
+        if argument == PIPE:
+            yield stage
+            stage = []
+        else:
+            stage.append(argument)
+    yield stage
+
+
+def results(value):
+    """Iterate over what a stage returned: its items, if it's a list or an
+    iterator, or else just it.
+    """
+    if value is None:
+        return iter(())
+    elif isinstance(value, string_types + (bytes,)):
+        return iter([value])
+    try:
+        return iter(value)
+    except TypeError:
+        return iter([value])
+
+
+class Pipe(object):
+    """What one stage of a pipeline returns, for the next one to read. It's
+    empty until that stage runs.
+    """
+    def __init__(self):
+        self.source = iter(())
+
+    def __iter__(self):
+        return self.source
+
+
+class Failure(object):
+    """An exception raised by a stage running in another thread or process,
+    to be raised again by the stage reading its results.
+    """
+    def __init__(self, error):
+        self.error = error
+
+    def __reduce__(self):
+        # exceptions that can't be pickled go between processes as messages.
+        try:
+            pickle.dumps(self.error)
+        except Exception:
+            return (Failure, (RuntimeError(str(self.error)),))
+        return (Failure, (self.error,))
+
+
+class Stopped(Exception):
+    """Raised in a stage running in another thread or process when the rest
+    of the pipeline has stopped, so that nothing will read its results.
+    """
+
+
+def offer(queue, item, stop):
+    "Put `item` on `queue`, waiting for room unless `stop` is set."
+    while not stop.is_set():
+        try:
+            queue.put(item, True, POLL_INTERVAL)
+            return
+        except Full:
+            pass
+    raise Stopped()
+
+
+def take(queue, stop):
+    "Get an item from `queue`, waiting for one unless `stop` is set."
+    while not stop.is_set():
+        try:
+            return queue.get(True, POLL_INTERVAL)
+        except Empty:
+            pass
+    raise Stopped()
+
+
+def produce(parser, bound, queue, stop):
+    """Run a stage, putting batches of its results on `queue`, until it's
+    done or `stop` is set.
+    """
+    try:
+        try:
+            batch = []
+            for item in results(parser.call(*bound)):
+                batch.append(item)
+                if len(batch) >= BATCH_SIZE:
+                    offer(queue, batch, stop)
+                    batch = []
+            if batch:
+                offer(queue, batch, stop)
+            # this means there's nothing more.
+            offer(queue, None, stop)
+        except Stopped:
+            raise
+        except Exception as e:
+            offer(queue, Failure(e), stop)
+    except Stopped:
+        # nobody will read what's still on its way, so a process shouldn't
+        # wait to send it before exiting.
+        cancel = getattr(queue, "cancel_join_thread", None)
+        if cancel is not None:
+            cancel()
+
+
+def drain(queue, stop):
+    "Yield the results a stage puts on `queue`, as they come."
+    while True:
+        batch = take(queue, stop)
+        if batch is None:
+            return
+        elif isinstance(batch, Failure):
+            raise batch.error
+        for item in batch:
+            yield item
+
+
+def finish(workers, stop):
+    """Stop the stages running in `workers` and wait for them to, terminating
+    any processes that don't in time.
+    """
+    stop.set()
+    for worker in workers:
+        worker.join(JOIN_TIMEOUT)
+        if worker.is_alive() and hasattr(worker, "terminate"):
+            worker.terminate()
+            worker.join()
+
+
+def finishing(result, workers, stop):
+    "Yield what the last stage returned, then stop the stages before it."
+    try:
+        for item in result:
+            yield item
+    finally:
+        finish(workers, stop)
+
+
+def reads(bound, pipe):
+    "Determine whether a stage bound to `bound` reads from `pipe`."
+    args, kwargs, _ = bound
+    for value in list(args) + list(kwargs.values()):
+        if isinstance(value, Reader) and value.source is pipe:
+            return True
+    return False
+
+
+def run_pipeline(parser, arguments, mode=None, first=None):
+    """Run a pipeline of subcommands of `parser`, given all of their arguments
+    with "--" between them, and return the parser of the last stage and what
+    it returned. Every stage's arguments are checked before any of them run.
+    If `first` is given, it's the parser and bound arguments of the first
+    stage, which have been read already, and `arguments` are the ones after
+    the first "--".
+    """
+    if mode not in MODES:
+        raise ValueError("Unknown pipeline mode: %r." % (mode,))
+    bound_stages = []
+    pipe = None
+    if first is not None:
+        pipe = Pipe()
+        bound_stages.append(first + (pipe,))
+    for stage in stages(arguments):
+        target, rest = parser.dispatch(stage)
+        bound = target.bind(rest, pipe)
+        # they asked for help with this stage, so nothing runs.
+        if bound is None:
+            return target, None
+        if pipe is not None and not reads(bound, pipe):
+            raise NameError("Illegal pipeline: '%s' doesn't read from a "
+                    "stream." % target.name)
+        pipe = Pipe()
+        bound_stages.append((target, bound, pipe))
+    if mode is None:
+        for target, bound, pipe in bound_stages:
+            result = target.call(*bound)
+            pipe.source = results(result)
+        return target, result
+    if mode == "threads":
+        import threading
+        try:
+            from queue import Queue
+        except ImportError:
+            from Queue import Queue
+        Event, Worker = threading.Event, threading.Thread
+    else:
+        import multiprocessing
+        # the stages are handed to their processes by forking, rather than
+        # by pickling them.
+        context = getattr(multiprocessing, "get_context", None)
+        context = context("fork") if context else multiprocessing
+        Queue, Event, Worker = context.Queue, context.Event, context.Process
+    # this tells every stage to give up, once the last one is done with
+    # them, however that happens.
+    stop = Event()
+    workers = []
+    try:
+        for target, bound, pipe in bound_stages[:-1]:
+            queue = Queue(QUEUE_SIZE)
+            worker = Worker(target=produce, args=(target, bound, queue, stop))
+            # a worker that doesn't stop in time shouldn't keep us running.
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+            pipe.source = drain(queue, stop)
+        target, bound, _ = bound_stages[-1]
+        result = target.call(*bound)
+    except BaseException:
+        finish(workers, stop)
+        raise
+    # a last stage that streams its results may still be reading from the
+    # others, so they're stopped when it's done.
+    if isinstance(result, Reader) or hasattr(result, "__next__") or \
+            hasattr(result, "next"):
+        return target, finishing(result, workers, stop)
+    finish(workers, stop)
+    return target, result
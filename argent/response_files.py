@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+""" Response files: an argument like "@path" stands for all of the arguments
+in the file at `path`, one per line. They're memory-mapped and read lazily,
+so that huge ones aren't copied around before they're needed. """
+
+import mmap
+import sys
+
+
+def decode(line):
+    "Turn a line from a response file into the kind of string argv has."
+    if sys.version_info[0] < 3:
+        return line
+    return line.decode(sys.getfilesystemencoding(), "surrogateescape")
+
+
+def read_response_file(path):
+    "Lazily yield each of the (non-empty) lines in the file at `path`."
+    try:
+        f = open(path, "rb")
+    except (IOError, OSError) as e:
+        raise NameError("Unreadable response file: '%s' (%s)." % (path,
+            e.strerror))
+    with f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped, but they're easy to read.
+            return
+        try:
+            for line in iter(mapped.readline, b""):
+                line = line.rstrip(b"\r\n")
+                if line:
+                    yield decode(line)
+        finally:
+            mapped.close()
+
+
+def expand(arguments, prefix="@"):
+    """Lazily yield `arguments`, with any that start with `prefix` replaced by
+    the contents of the response file they name.
+    """
+    for argument in arguments:
+        if argument.startswith(prefix) and len(argument) > len(prefix):
+            for line in read_response_file(argument[len(prefix):]):
+                yield line
+        else:
+            yield argument
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+""" Input streams: a parameter whose default (or annotation) is a `Stream`
+gets a lazily opened reader over the file named on the command line, or over
+stdin if there isn't one or it's "-":
+
+    @Parser.from_function
+    def count(lines=Stream()):
+        "Count the lines in a file or stdin."
+        return sum(1 for line in lines)
+
+Readers are iterated a line (or, for binary streams, a chunk) at a time
+through large buffers, so that nothing is read into memory all at once.
+"""
+
+import io
+import sys
+
+from argent.conversion import string_types
+
+
+class Stream(object):
+    "A marker for parameters that read from a stream, and how to read it."
+    def __init__(self, binary=False, chunk_size=64 * 1024,
+            buffering=1024 * 1024, encoding=None):
+        # binary streams are read in chunks of bytes; others, lines of text.
+        self.binary = binary
+        self.chunk_size = chunk_size
+        self.buffering = buffering
+        self.encoding = encoding
+
+    def open(self, source=None):
+        """Return a `Reader` for `source`: a path, "-" or None for stdin, or
+        any iterable (like another command's results) to read from directly.
+        """
+        return Reader(self, source)
+
+    # this makes a Stream its own converter.
+    __call__ = open
+
+
+def as_stream(obj):
+    "Return the Stream that `obj` stands for (Stream means Stream()), if any."
+    if obj is Stream:
+        return Stream()
+    elif isinstance(obj, Stream):
+        return obj
+    return None
+
+
+def reopen(obj):
+    """Return a new `Reader` over the same source, if `obj` is a Reader, so
+    that it can be read again from the start; otherwise, return `obj`.
+    """
+    if isinstance(obj, Reader):
+        return Reader(obj.stream, obj.source)
+    return obj
+
+
+class Reader(object):
+    "A lazily opened, buffered reader of lines or chunks from somewhere."
+    def __init__(self, stream, source=None):
+        self.stream = stream
+        self.source = source
+        self._file = None
+
+    def _stdin(self):
+        stdin = sys.stdin
+        # read straight from the file descriptor, with a bigger buffer, when
+        # there is one.
+        try:
+            raw = io.open(stdin.fileno(), "rb", self.stream.buffering,
+                    closefd=False)
+        except (AttributeError, ValueError, io.UnsupportedOperation):
+            return getattr(stdin, "buffer", stdin) if self.stream.binary \
+                else stdin
+        return self._decode(raw)
+
+    def _decode(self, raw):
+        if self.stream.binary:
+            return raw
+        return io.TextIOWrapper(raw, encoding=self.stream.encoding)
+
+    @property
+    def file(self):
+        "The underlying file, opening it if it isn't yet."
+        if self._file is None:
+            if self.source is None or self.source == "-":
+                self._file = self._stdin()
+            else:
+                self._file = self._decode(io.open(self.source, "rb",
+                    self.stream.buffering))
+        return self._file
+
+    def __iter__(self):
+        # anything besides a path is read from directly.
+        if self.source is not None and not isinstance(self.source,
+                string_types):
+            return iter(self.source)
+        if self.stream.binary:
+            size = self.stream.chunk_size
+            read = self.file.read
+            return iter(lambda: read(size), b"")
+        return iter(self.file)
+
+    def read(self, size=-1):
+        "Read `size` bytes or characters, or everything if it's negative."
+        return self.file.read(size)
+
+    def readline(self):
+        return self.file.readline()
+
+    def close(self):
+        "Close the underlying file, unless it's stdin."
+        if self._file is not None and self.source not in (None, "-"):
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
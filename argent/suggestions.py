@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+""" "Did you mean" suggestions for mistyped subcommands and flags. """
+
+
+def bit_vectors(word):
+    "Map each character in `word` to a bit mask of where it is in it."
+    masks = {}
+    for i, c in enumerate(word):
+        masks[c] = masks.get(c, 0) | 1 << i
+    return masks
+
+
+def bounded_distance(masks, length, text, limit):
+    """Determine the Levenshtein distance between `text` and the word of
+    `length` characters that `masks` are the `bit_vectors` of, a column at a
+    time in a few operations on integers (this is Myers's algorithm). Once
+    it's sure to be more than `limit`, return `limit + 1` instead.
+    """
+    if abs(length - len(text)) > limit:
+        return limit + 1
+    elif not length:
+        return len(text)
+    everything = (1 << length) - 1
+    last = 1 << (length - 1)
+    plus, minus, score = everything, 0, length
+    remaining = len(text)
+    for c in text:
+        match = masks.get(c, 0)
+        vertical = match | minus
+        horizontal = (((match & plus) + plus) ^ plus) | match
+        up = minus | ~(horizontal | plus)
+        down = plus & horizontal
+        if up & last:
+            score += 1
+        elif down & last:
+            score -= 1
+        # each character left can only bring it down by one.
+        remaining -= 1
+        if score - remaining > limit:
+            return limit + 1
+        up = (up << 1) | 1
+        down <<= 1
+        plus = (down | ~(vertical | up)) & everything
+        minus = up & vertical & everything
+    return score
+
+
+def distance(a, b, limit=None):
+    """Determine the Levenshtein distance between two strings. If `limit` is
+    given and it's more than that, return `limit + 1` instead.
+    """
+    if limit is None:
+        limit = max(len(a), len(b))
+    return bounded_distance(bit_vectors(a), len(a), b, limit)
+
+
+class Index(object):
+    """Words grouped by length, so that finding the ones close to a given
+    word only measures the distance to those whose lengths are close enough.
+    """
+    __slots__ = ("lengths",)
+
+    def __init__(self, words=()):
+        self.lengths = {}
+        for word in words:
+            self.lengths.setdefault(len(word), []).append(word)
+
+    def search(self, word, tolerance):
+        """Return (distance, word) pairs for every word within `tolerance`
+        of `word`, closest first.
+        """
+        found = []
+        masks = bit_vectors(word)
+        for length in range(len(word) - tolerance, len(word) + tolerance + 1):
+            for other in self.lengths.get(length, ()):
+                d = bounded_distance(masks, len(word), other, tolerance)
+                if d <= tolerance:
+                    found.append((d, other))
+        return sorted(found)
+
+
+def tolerance(word):
+    "Determine how different a suggestion for `word` can be."
+    length = len(word.lstrip("-"))
+    if length <= 2:
+        return 1
+    return 2 if length <= 8 else 3
+
+
+def suggest(index, word, limit=3):
+    "Return up to `limit` words in `index` that `word` might be a typo of."
+    return [w for _, w in index.search(word, tolerance(word))[:limit]]
+
+
+def did_you_mean(suggestions):
+    "Phrase some suggestions as a question, if there are any."
+    if not suggestions:
+        return ""
+    return " Did you mean %s?" % " or ".join("'%s'" % s for s in suggestions)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+""" Timing what argent spends its time on. Hooks added with `add_hook` get an
+event for each phase -- introspecting functions, constructing parsers,
+dispatching to subparsers, binding arguments, formatting help and calling
+the function -- as a dictionary with its name, start time and duration in
+seconds, the thread it happened on and some counters in "args".
+
+Setting $ARGENT_TRACE to a path writes every event in the process to that
+file, in Chrome's trace format, when it exits. When nothing is listening,
+argent doesn't measure anything at all.
+"""
+
+import os
+import time
+
+
+# this is True whenever there are any hooks.
+active = False
+_hooks = []
+
+# the most precise clock there is.
+clock = getattr(time, "perf_counter", time.time)
+
+
+def add_hook(hook):
+    "Call `hook` with every event from now on."
+    global active
+    _hooks.append(hook)
+    active = True
+
+
+def remove_hook(hook):
+    "Stop calling `hook` with events."
+    global active
+    _hooks.remove(hook)
+    active = bool(_hooks)
+
+
+def emit(name, start, **counters):
+    """Send an event called `name` that started at `start` and ended now to
+    every hook.
+    """
+    end = clock()
+    import threading
+    event = {"name": name, "start": start, "duration": end - start,
+        "thread": threading.current_thread().ident, "args": counters}
+    for hook in list(_hooks):
+        hook(event)
+
+
+class ChromeTrace(object):
+    """A hook that keeps events so that they can be saved as a trace for
+    chrome://tracing or Perfetto.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.events = []
+        self.pid = os.getpid()
+
+    def __call__(self, event):
+        self.events.append({"name": event["name"], "ph": "X",
+            "ts": event["start"] * 1e6, "dur": event["duration"] * 1e6,
+            "pid": self.pid, "tid": event["thread"], "args": event["args"]})
+
+    def save(self):
+        "Write the events so far to `self.path`."
+        import json
+        with open(self.path, "w") as f:
+            json.dump({"traceEvents": self.events}, f)
+
+
+def trace_to(path):
+    "Save every event in this process to `path` when it exits."
+    import atexit
+    trace = ChromeTrace(path)
+    add_hook(trace)
+    atexit.register(trace.save)
+    return trace
+
+
+if os.environ.get("ARGENT_TRACE"):
+    trace_to(os.environ["ARGENT_TRACE"])
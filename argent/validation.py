@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+""" Checking command lines without running them. `validate` goes through the
+same subcommands and the same checks of flags and arguments as parsing does,
+but never calls any function, and rather than stopping at the first problem
+it returns a `Diagnostic` for each of them:
+
+    >>> [d.kind for d in parser.validate("hello --flga a b")]
+    ['unknown-flag', 'too-many-arguments']
+
+Positions are indexes into the command line's arguments, after any response
+files are expanded; problems with the command line as a whole, like missing
+arguments, are at the end of it.
+"""
+
+from collections import namedtuple
+import sys
+
+from argent.arguments import help_arg
+from argent.batch import read_command_lines, split
+from argent.conversion import string_types
+from argent.parser import PIPE
+from argent.streams import Stream
+
+# the kinds of problem there are; "syntax" is for lines that don't split,
+# like ones with an unclosed quote, "unreadable" for response files that
+# can't be read, "unloadable" for lazy subcommands that can't be imported,
+# and "not-piped" is for stages of a pipeline that have nowhere to read the
+# one before's results from.
+KINDS = ("syntax", "unreadable", "unloadable", "unknown-flag",
+        "unknown-subcommand", "too-many-arguments", "too-few-arguments",
+        "invalid-value", "not-piped")
+
+# one problem with a command line: its kind, a message like the one parsing
+# would raise, and the index of the argument it's about.
+Diagnostic = namedtuple("Diagnostic", ["kind", "message", "position"])
+
+
+def validate(parser, command_line):
+    """Check `command_line` -- a string, which is split like a shell would,
+    or a list of arguments -- against `parser` and its subparsers, and return
+    a list of `Diagnostic`s. It's empty if the command line is fine.
+    """
+    if isinstance(command_line, string_types):
+        try:
+            command_line = split(command_line)
+        except ValueError as e:
+            return [Diagnostic("syntax", str(e).capitalize() + ".", 0)]
+    try:
+        expanded = list(parser.expand(command_line))
+    except NameError as e:
+        return [Diagnostic("unreadable", str(e), 0)]
+    if PIPE not in expanded:
+        return check(parser, expanded)
+    # each stage of a pipeline is checked on its own.
+    from argent.pipeline import stages
+    diagnostics = []
+    offset = 0
+    for number, stage in enumerate(stages(expanded)):
+        diagnostics.extend(check(parser, stage, offset, number > 0))
+        # (the "--" takes up a position, too.)
+        offset += len(stage) + 1
+    return diagnostics
+
+
+def check(parser, arguments, offset=0, piped=False):
+    """Check some arguments, which start at `offset` in their command line,
+    and return a list of `Diagnostic`s. If they're `piped` into, they need a
+    stream argument to read that from.
+    """
+    # follow the subcommands at the start; the rest are this parser's. a
+    # subcommand that can't be imported is a problem with the command line
+    # like any other.
+    try:
+        parser, rest = parser.dispatch(arguments)
+    except Exception as e:
+        return [Diagnostic("unloadable", "Couldn't load subcommand: %s" % e,
+            offset)]
+    rest = list(rest)
+    start = offset + len(arguments) - len(rest)
+    diagnostics = []
+    def unknown(index, flag):
+        diagnostics.append(Diagnostic("unknown-flag",
+            str(parser._error("Illegal flags", flag)), start + index))
+    # these are sorted, counted and converted just as parsing does.
+    flags, positional, positions = parser._sort(rest, unknown)
+    # asking for help is never wrong, whatever else is there.
+    if help_arg in flags:
+        return diagnostics
+    positions = [start + index for index in positions]
+    problem = parser._count_problem(positional)
+    if problem is not None:
+        kind, error, index = problem
+        diagnostics.append(Diagnostic(kind, str(error),
+            start + len(rest) if index is None else positions[index]))
+    # something has to read what the last stage returned.
+    if piped and not any(index >= len(positional)
+            for index, _, _ in parser._streams):
+        diagnostics.append(Diagnostic("not-piped", "Illegal pipeline: '%s' "
+            "doesn't read from a stream." % parser.name, offset))
+    # check that the values convert; streams aren't opened, though.
+    for (slot, convert, name), value, position in zip(parser._slots,
+            positional, positions):
+        if convert is None or isinstance(convert, Stream):
+            continue
+        try:
+            parser._convert(convert, name, value)
+        except ValueError as e:
+            diagnostics.append(Diagnostic("invalid-value", str(e), position))
+    extra = positional[len(parser._slots):]
+    if extra and parser.variadic is not None:
+        try:
+            parser._convert_extra(extra)
+        except ValueError as e:
+            diagnostics.append(Diagnostic("invalid-value", str(e),
+                positions[len(parser._slots)]))
+    return diagnostics
+
+
+def validate_many(parser, command_lines):
+    """Check each of an iterable of command lines with `parser`, yielding a
+    list of `Diagnostic`s for each of them in order.
+    """
+    for command_line in command_lines:
+        yield validate(parser, command_line)
+
+
+def run_validate(parser, arguments):
+    """Handle `--validate [--null] [FILE]`: check every command line in FILE
+    (or stdin) without running any of them, writing their problems to
+    stdout. Return the number of command lines with problems.
+    """
+    null = "--null" in arguments
+    paths = [a for a in arguments if a != "--null"]
+    if paths and paths[0] != "-":
+        stream = open(paths[0])
+    else:
+        stream = sys.stdin
+    failures = 0
+    try:
+        lines = validate_many(parser, read_command_lines(stream, null))
+        for number, diagnostics in enumerate(lines, 1):
+            if diagnostics:
+                failures += 1
+            for d in diagnostics:
+                sys.stdout.write("line %d, argument %d: %s: %s\n" % (number,
+                    d.position, d.kind, d.message))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return failures
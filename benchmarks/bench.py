@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Benchmarks for argent, run on synthetic command-line programs."""
+
+from __future__ import print_function
+
+import gc
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    os.pardir))
+
+from argent import Parser
+from argent.arguments import arguments_from_function
+from argent.docstrings import parse_docstring
+
+
+def make_function(name, flags=0, args=0, doc_lines=0):
+    """Make a function called `name` with `flags` flags (each with a synonym),
+    `args` positional arguments (half of them optional), and a docstring
+    with `doc_lines` lines of prose after the argument descriptions.
+    """
+    parameters = ["__flag%d" % i for i in range(flags)]
+    parameters += ["arg%d" % i for i in range(args - args // 2)]
+    parameters += ["opt%d='default'" % i for i in range(args // 2)]
+    doc = ["Synthetic command %s." % name, ""]
+    doc += ["    --flag%d, --f%d: turns on feature number %d." % (i, i, i)
+        for i in range(flags)]
+    doc += ["    arg%d: positional argument number %d." % (i, i)
+        for i in range(args - args // 2)]
+    doc += ["    opt%d: optional argument number %d." % (i, i)
+        for i in range(args // 2)]
+    doc += ["    This line is filler, see http://example.com/%d for more." % i
+        for i in range(doc_lines)]
+    source = "def %s(%s):\n    %r\n    return locals()\n" % (name,
+            ", ".join(parameters), "\n".join(doc))
+    namespace = {}
+    exec(source, namespace)
+    return namespace[name]
+
+
+def make_cli(subcommands=0, flags=0, args=0, doc_lines=0, depth=1):
+    """Make a parser with `subcommands` subcommands on each level of `depth`
+    levels of nesting, each made by `make_function`.
+    """
+    root = Parser.from_function(make_function("root", flags, args, doc_lines))
+    level = [root]
+    for d in range(depth):
+        next_level = []
+        for parent in level:
+            for i in range(subcommands):
+                fn = make_function("cmd%d_%d" % (d, i), flags, args,
+                        doc_lines)
+                next_level.append(parent.subparse(fn))
+        # only nest under the first subcommand, or deep trees would be huge.
+        level = next_level[:1]
+    return root
+
+
+def regex_docstring(doc):
+    "Parse a docstring the way argent did before argent.docstrings."
+    descriptions = {}
+    synonyms = {}
+    for m in re.finditer(r'^\s*(.+?)\s*:\s?(.+?)\s*$', doc, re.MULTILINE):
+        these_synonyms = re.split(r',\s?', m.group(1))
+        name = these_synonyms[0].replace("-", "_")
+        descriptions[name] = m.group(2)
+        synonyms[name] = these_synonyms[1:]
+    return descriptions, synonyms
+
+
+def best_of(fn, repeat=5, number=1):
+    "Time `fn`, returning the best time per call of `repeat` trials."
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.time()
+        for _ in range(number):
+            fn()
+        times.append((time.time() - start) / number)
+    return min(times)
+
+
+def peak_memory(fn):
+    """Return the peak memory, in bytes, allocated while calling `fn`, or None
+    if there's no way to tell.
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmarks(full=False):
+    "Yield (name, parameters, function, calls per trial) for each benchmark."
+    # the full sizes take a while, so by default the largest are left out.
+    sizes = (lambda *s: s) if full else (lambda *s: s[:-1])
+    for subcommands in sizes(1, 100, 1000, 10000):
+        yield ("construct", {"subcommands": subcommands, "flags": 5},
+            lambda s=subcommands: make_cli(s, 5, 2), 1)
+    for flags in sizes(0, 50, 500):
+        fn = make_function("f", flags, 4, 20)
+        yield ("from_function", {"flags": flags},
+            lambda fn=fn: Parser.from_function(fn), 10)
+        yield ("arguments_from_function", {"flags": flags},
+            lambda fn=fn: arguments_from_function(fn), 10)
+    for lines in sizes(100, 1000, 10000):
+        doc = make_function("f", lines // 10, 0, lines).__doc__
+        yield ("docstring", {"lines": lines},
+            lambda d=doc: parse_docstring(d), 10)
+        yield ("docstring_regex", {"lines": lines},
+            lambda d=doc: regex_docstring(d), 10)
+    for depth in (1, 5, 20):
+        parser = make_cli(2, 5, 2, depth=depth)
+        argv = ["cmd%d_0" % d for d in range(depth)] + ["--flag0", "a"]
+        yield ("parse_depth", {"depth": depth},
+            lambda p=parser, a=argv: p.parse(a), 1000)
+    for flags in sizes(5, 50, 500):
+        for tokens in (1, 100, 10000):
+            parser = Parser.from_function(make_function("f", flags, 0))
+            argv = ["--flag%d" % (i % flags) for i in range(tokens)]
+            yield ("parse_tokens", {"flags": flags, "tokens": tokens},
+                lambda p=parser, a=argv: p.parse(a), max(1, 1000 // tokens))
+    for subcommands in sizes(10, 1000, 10000):
+        parser = make_cli(subcommands, 5, 2)
+        yield ("help", {"subcommands": subcommands},
+            lambda p=parser: p.help.format(80), 1)
+
+
+def git_revision():
+    "Determine the commit being benchmarked, if this is a git checkout."
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.STDOUT).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@Parser.from_function
+def bench():
+    "Benchmarks for argent."
+    bench.help()
+
+
+@bench.subparse
+def run(__full, output="-"):
+    """Run the benchmarks and write the results as JSON.
+
+    --full: use the full sizes (up to 10,000 subcommands and 500 flags).
+    output: the file to write the results to; by default, stdout.
+    """
+    results = []
+    for name, parameters, fn, number in benchmarks(__full):
+        seconds = best_of(fn, number=number)
+        results.append({"name": name, "parameters": parameters,
+            "seconds": seconds})
+        print("%-24s %-36s %12.6fs" % (name, json.dumps(parameters,
+            sort_keys=True), seconds), file=sys.stderr)
+    memory = peak_memory(lambda: make_cli(10000 if __full else 1000, 5, 2))
+    report = {"revision": git_revision(), "python": platform.python_version(),
+        "results": results, "peak_memory": memory}
+    if output == "-":
+        json.dump(report, sys.stdout, indent=1, sort_keys=True)
+    else:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+
+
+@bench.subparse
+def compare(before, after):
+    """Compare two sets of results from `run`.
+
+    before: the results to compare against.
+    after: the new results.
+    """
+    with open(before) as f:
+        old = json.load(f)
+    with open(after) as f:
+        new = json.load(f)
+    key = lambda r: (r["name"], json.dumps(r["parameters"], sort_keys=True))
+    old_results = dict((key(r), r["seconds"]) for r in old["results"])
+    for result in new["results"]:
+        if key(result) in old_results:
+            ratio = result["seconds"] / (old_results[key(result)] or 1e-12)
+            print("%-24s %-36s %8.2fx" % (key(result) + (ratio,)))
+    if old.get("peak_memory") and new.get("peak_memory"):
+        print("%-61s %8.2fx" % ("peak memory",
+            float(new["peak_memory"]) / old["peak_memory"]))
+
+
+if __name__ == "__main__":
+    bench.command_line()
@@ -10,7 +10,6 @@ setup(
     keywords = ["command-line", "arguments", "flags", "argparse"],
     description = "Parse command-line arguments using introspective magic.",
     packages = ["argent"],
-    install_requires = ["Clint"],
     classifiers = [
         "Programming Language :: Python",
         "Operating System :: OS Independent",
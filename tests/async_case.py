@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""This is a test case for argent's handling of coroutine functions. It needs
+python 3.5 or later."""
+
+import asyncio
+
+from argent.parser import Parser
+
+
+@Parser.from_function
+def parser():
+    "A test parser with coroutine subcommands."
+    return "Not a coroutine."
+
+
+@parser.subparse
+async def wait(__twice, something="waited"):
+    """Wait a moment, then return `something`.
+
+    --twice: return `something` twice.
+    something: what to return.
+    """
+    await asyncio.sleep(0)
+    if __twice:
+        return something * 2
+    return something
+
+
+@parser.subparse
+async def loop():
+    "Return the event loop this runs on."
+    return asyncio.get_event_loop()
+
+
+# how many times `counted` has run.
+calls = []
+
+
+async def counted(number):
+    "Count a call, and return `number`."
+    calls.append(number)
+    await asyncio.sleep(0)
+    return number
+
+
+async def parse_concurrently(*command_lines):
+    "Parse several command lines concurrently with `parse_async`."
+    return await asyncio.gather(*[parser.parse_async(arguments)
+        for arguments in command_lines])
+
+
+async def parse_in_order(parser, *command_lines):
+    "Parse several command lines one after another with `parse_async`."
+    return [await parser.parse_async(arguments)
+        for arguments in command_lines]
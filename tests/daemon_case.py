@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+"""Subcommands for argent's daemon tests."""
+
+import sys
+
+from argent import Parser
+
+
+@Parser.from_function
+def parser():
+    "A test parser for the daemon."
+
+
+@parser.subparse
+def spew(lines):
+    "Write `lines` lines to stdout, without reading stdin."
+    line = "x" * 1023 + "\n"
+    for _ in range(int(lines)):
+        sys.stdout.write(line)
@@ -0,0 +1,11 @@
+#!/usr/bin/env python
+"""Subcommands for argent's lazy registration tests. Whether this module has
+been imported is part of what those tests check."""
+
+
+def greet(name="world"):
+    """Greet someone.
+
+    name: who to greet.
+    """
+    return "hello, %s" % name
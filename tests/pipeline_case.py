@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""Subcommands for argent's pipeline tests, which chain them together."""
+
+from argent import Parser, Stream
+
+
+@Parser.from_function
+def parser():
+    "A test parser for pipelines."
+
+
+@parser.subparse
+def numbers(count):
+    "Yield the numbers from zero up to `count`."
+    for n in range(int(count)):
+        yield n
+
+
+@parser.subparse
+def double(items=Stream):
+    "Double each of the items."
+    for item in items:
+        yield item * 2
+
+
+@parser.subparse
+def total(items=Stream):
+    "Add up the items."
+    return sum(items)
+
+
+@parser.subparse
+def first(items=Stream):
+    "Return the first of the items."
+    return next(iter(items))
+
+
+@parser.subparse
+def fail(items=Stream):
+    "Pass the items on, but fail at the first one that's over two."
+    for item in items:
+        if item > 2:
+            raise ValueError("too big: %d" % item)
+        yield item
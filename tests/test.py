@@ -1,6 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
 import unittest
 
 class FirstCase(unittest.TestCase):
@@ -78,6 +85,1269 @@ class FirstCase(unittest.TestCase):
         [arg] = [a for a in hello_parser.args if a.name == "something"]
         self.assertEqual(arg.description, "some junk, idk.")
 
+    def test_recompile_flags(self):
+        "Test that assigning a parser's flags changes which flags it accepts."
+        hello_parser = self.parser.subparsers["hello"]
+        old_flags = hello_parser.flags
+        try:
+            hello_parser.flags = [f for f in old_flags if f.name != "--f"]
+            self.assertRaises(NameError, hello_parser.parse, ["--flag"])
+        finally:
+            hello_parser.flags = old_flags
+        self.assertParser(["hello", "--flag"], "hello")
+
+
+@unittest.skipIf(sys.version_info < (3, 5), "needs async def")
+class AsyncCase(unittest.TestCase):
+    def setUp(self):
+        import async_case
+        self.parser = async_case.parser
+
+    def test_detected(self):
+        "Test that coroutine functions are detected."
+        self.assertTrue(self.parser.subparsers["wait"].coroutine)
+        self.assertFalse(self.parser.coroutine)
+
+    def test_parse(self):
+        "Test that parse runs coroutine functions to completion."
+        self.assertEqual(self.parser.parse(["wait", "--twice", "ab"]), "abab")
+
+    def test_shared_loop(self):
+        "Test that every command runs on the same event loop."
+        self.assertIs(self.parser.parse(["loop"]), self.parser.parse(["loop"]))
+
+    def test_parse_async(self):
+        "Test that parse_async can be awaited in a running loop."
+        import asyncio
+        import async_case
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(
+                    async_case.parse_concurrently(["wait"], []))
+        finally:
+            loop.close()
+        self.assertEqual(results, ["waited", "Not a coroutine."])
+
+    def test_async_cache(self):
+        "Test that parse_async caches results, unless told not to."
+        import asyncio
+        import async_case
+        from argent import Parser
+        from argent.cache import ResultCache
+        directory = tempfile.mkdtemp()
+        parser = Parser()
+        parser.subparse(async_case.counted, cache=ResultCache(directory))
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(async_case.parse_in_order(
+                parser, ["counted", "1"], ["counted", "1"],
+                ["counted", "1", "--no-cache"]))
+        finally:
+            loop.close()
+            shutil.rmtree(directory)
+        self.assertEqual(results, ["1", "1", "1"])
+        self.assertEqual(async_case.calls, ["1", "1"])
+
+    def test_async_pipeline(self):
+        "Test that parse_async refuses pipelines rather than misreading them."
+        import pipeline_case
+        self.assertRaises(NameError, pipeline_case.parser.parse_async,
+                ["numbers", "3", "--", "total"])
+
+
+class BatchCase(unittest.TestCase):
+    def setUp(self):
+        import first_case
+        self.parser = first_case.parser
+
+    def test_parse_many(self):
+        "Test that results and errors come back in order."
+        outcomes = list(self.parser.parse_many(
+            ["hello --f 'two words'", ["hello"], "hello --n"]))
+        self.assertEqual([o.result for o in outcomes],
+                ["two words", "goodbye", None])
+        self.assertEqual(outcomes[0].arguments, ["hello", "--f", "two words"])
+        self.assertIsInstance(outcomes[2].error, NameError)
+
+    def test_processes(self):
+        "Test that a process pool gives the same results, in order."
+        lines = ["hello --f %d" % i for i in range(50)]
+        outcomes = list(self.parser.parse_many(lines, processes=2))
+        self.assertEqual([o.result for o in outcomes],
+                [str(i) for i in range(50)])
+
+    @unittest.skipIf(sys.version_info < (3, 4), "needs set_start_method")
+    def test_spawn_default(self):
+        "Test that a process pool works whatever the start method is."
+        import multiprocessing
+        method = multiprocessing.get_start_method()
+        multiprocessing.set_start_method("spawn", force=True)
+        try:
+            outcomes = list(self.parser.parse_many(["hello --f x"],
+                processes=1))
+        finally:
+            multiprocessing.set_start_method(method, force=True)
+        self.assertEqual([o.result for o in outcomes], ["x"])
+
+    def test_null_delimited(self):
+        "Test reading NUL-delimited command lines."
+        from argent.batch import read_command_lines
+        stream = io.StringIO(u"hello\0hello --f\0\0something a b")
+        self.assertEqual(list(read_command_lines(stream, null=True, size=4)),
+                ["hello", "hello --f", "something a b"])
+
+
+class DaemonCase(unittest.TestCase):
+    def setUp(self):
+        import first_case
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "socket")
+        self.server = self.start(first_case.parser, self.path)
+
+    def start(self, parser, path):
+        import multiprocessing
+        from argent import daemon
+        server = multiprocessing.Process(target=daemon.serve,
+                args=(parser, path),
+                kwargs={"idle_timeout": 10, "watch": False, "poll": 0.05})
+        server.start()
+        return server
+
+    def tearDown(self):
+        self.server.terminate()
+        self.server.join()
+        shutil.rmtree(self.directory)
+
+    def run_client(self, arguments, path=None, stdin=None):
+        from argent import client
+        path = path or self.path
+        stdout, stderr = io.BytesIO(), io.BytesIO()
+        for _ in range(200):
+            if os.path.exists(path):
+                break
+            time.sleep(0.01)
+        code, result = client.run(path, ["first_case.py"] + arguments,
+                stdin=stdin, stdout=stdout, stderr=stderr)
+        return code, result, stdout.getvalue(), stderr.getvalue()
+
+    def test_result(self):
+        "Test that the server relays the return value and exit code."
+        code, result, _, _ = self.run_client(["hello", "--f", "x"])
+        self.assertEqual((code, result), (0, "x"))
+
+    def test_output(self):
+        "Test that the server relays stdout."
+        code, _, stdout, _ = self.run_client(["hello", "--h"])
+        self.assertEqual(code, 0)
+        self.assertIn(b"usage: first_case.py hello", stdout)
+
+    def test_error(self):
+        "Test that errors give a nonzero exit code and a traceback."
+        code, _, _, stderr = self.run_client(["hello", "--nope"])
+        self.assertEqual(code, 1)
+        self.assertIn(b"Illegal flags", stderr)
+
+    def test_unread_stdin(self):
+        "Test that lots of stdin doesn't block lots of output."
+        import threading
+        import daemon_case
+        path = os.path.join(self.directory, "spew")
+        server = self.start(daemon_case.parser, path)
+        input = os.path.join(self.directory, "input")
+        with open(input, "wb") as f:
+            f.write(b"\0" * (8 * 1024 * 1024))
+        outcome = []
+        def run():
+            with open(input, "rb") as stdin:
+                outcome.append(self.run_client(["spew", "8192"], path,
+                    stdin.fileno()))
+        try:
+            thread = threading.Thread(target=run)
+            thread.daemon = True
+            thread.start()
+            thread.join(60)
+            self.assertFalse(thread.is_alive())
+        finally:
+            server.terminate()
+            server.join()
+        code, _, stdout, _ = outcome[0]
+        self.assertEqual(code, 0)
+        self.assertEqual(len(stdout), 8192 * 1024)
+
+    def test_private_socket(self):
+        "Test that sockets go in a directory only we can get into."
+        import stat
+        from argent import client
+        directory = os.path.dirname(client.socket_path("program"))
+        info = os.lstat(directory)
+        self.assertEqual(info.st_uid, os.getuid())
+        self.assertEqual(stat.S_IMODE(info.st_mode) & 0o077, 0)
+        shared = os.path.join(self.directory, "shared")
+        os.mkdir(shared)
+        os.chmod(shared, 0o777)
+        self.assertRaises(OSError, client.private_directory, shared)
+
+    @unittest.skipIf(not sys.platform.startswith("linux"), "needs SO_PEERCRED")
+    def test_peer_credentials(self):
+        "Test that both ends can see who's at the other."
+        import socket
+        from argent import client
+        a, b = socket.socketpair(socket.AF_UNIX)
+        try:
+            self.assertEqual(client.peer_uid(a), os.getuid())
+            self.assertTrue(client.trusted(b))
+        finally:
+            a.close()
+            b.close()
+
+
+class HelpCase(unittest.TestCase):
+    def setUp(self):
+        import first_case
+        self.parser = first_case.parser
+        self.hello = first_case.hello
+
+    def test_help_message(self):
+        "Test that the help message lists flags and arguments."
+        message = self.hello.help.render(80)
+        self.assertIn("usage: ", message)
+        self.assertIn("--f, --flag", message)
+        self.assertIn("some junk, idk.", message)
+
+    def test_help_memoized(self):
+        "Test that help messages are only rendered once for each width."
+        self.assertIs(self.parser.help.render(80), self.parser.help.render(80))
+
+    def test_help_invalidated(self):
+        "Test that adding a subparser changes the parent's help message."
+        from argent import Parser
+        parser = Parser.from_function(lambda: None)
+        parser.description = "A parser."
+        before = parser.help.render(80)
+        parser.subparse(lambda: None)
+        self.assertNotEqual(before, parser.help.render(80))
+        self.assertIn("Subcommands:", parser.help.render(80))
+
+    def test_columns(self):
+        "Test that words and descriptions are wrapped into padded columns."
+        from argent.help import word_description
+        self.assertEqual(word_description([("a-very-long-flag",
+            "one two three four five six\nseven"), ("x", "")], 35).split(
+            "\n"), [
+            "   a-very-long-f one two three four   ",
+            "   lag           five six             ",
+            "                 seven                ",
+            "   x                                  "])
+
+
+class CompletionCase(unittest.TestCase):
+    def setUp(self):
+        from argent.completion import build_index
+        import first_case
+        self.index = build_index(first_case.parser)
+
+    def assertCompletes(self, words, expected):
+        from argent.completion import complete
+        self.assertEqual(complete(self.index, words), expected)
+
+    def test_subcommands(self):
+        "Test that subcommand names are completed."
+        self.assertCompletes(["hel"], ["hello"])
+        self.assertCompletes([""], ["hello", "something"])
+
+    def test_flags(self):
+        "Test that all of a subcommand's flag synonyms are completed."
+        self.assertCompletes(["hello", "--f"], ["--f", "--flag"])
+
+    def test_stored_index(self):
+        "Test that a stored index is used without importing lazy subparsers."
+        from argent import Parser, completion
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "index")
+            parser = Parser.from_function(lambda: None)
+            parser.subparse_lazy("lazy_commands:greet")
+            completion.write_index(parser, path)
+            sys.modules.pop("lazy_commands")
+            parser = Parser.from_function(lambda: None)
+            parser.subparse_lazy("lazy_commands:greet")
+            index = completion.load_index(parser, path)
+            self.assertEqual(completion.complete(index, ["g"]), ["greet"])
+            self.assertNotIn("lazy_commands", sys.modules)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_stale_source(self):
+        "Test that editing a lazily registered module rebuilds the index."
+        from argent import Parser, completion
+        directory = tempfile.mkdtemp()
+        source = os.path.join(directory, "edited_commands.py")
+        sys.path.insert(0, directory)
+        try:
+            with open(source, "w") as f:
+                f.write("def edit():\n    'Before.'\n")
+            path = os.path.join(directory, "index")
+            parser = Parser.from_function(lambda: None)
+            parser.subparse_lazy("edited_commands:edit")
+            completion.write_index(parser, path)
+            self.assertIn(source, completion.load_index(parser, path)[
+                "sources"])
+            with open(source, "w") as f:
+                f.write("def edit():\n    'After.'\n")
+            # make sure the change is visible even on coarse filesystems.
+            os.utime(source, (time.time() + 10, time.time() + 10))
+            sys.modules.pop("edited_commands")
+            parser = Parser.from_function(lambda: None)
+            parser.subparse_lazy("edited_commands:edit")
+            index = completion.load_index(parser, path)
+            self.assertEqual(completion.complete(index, ["e"], True),
+                    [("edit", "After.")])
+        finally:
+            sys.path.remove(directory)
+            sys.modules.pop("edited_commands", None)
+            shutil.rmtree(directory)
+
+    def test_unwritable_directory(self):
+        "Test that indexes go in the cache directory if they must."
+        from argent import completion
+        from argent.cache import default_directory
+        access = os.access
+        # (root can write anywhere, so pretend.)
+        os.access = lambda path, mode: False
+        try:
+            path = completion.index_path("/usr/local/bin/tool")
+        finally:
+            os.access = access
+        self.assertTrue(path.startswith(default_directory()))
+        self.assertTrue(os.path.basename(path).startswith("tool-"))
+
+
+class LazyCase(unittest.TestCase):
+    def setUp(self):
+        from argent import Parser
+        sys.modules.pop("lazy_commands", None)
+        self.parser = Parser.from_function(lambda: None)
+        self.parser.subparse_lazy("lazy_commands:greet",
+                description="Greet someone.")
+
+    def test_not_imported(self):
+        "Test that describing a lazy subcommand doesn't import it."
+        self.assertEqual(self.parser.subparsers["greet"].description,
+                "Greet someone.")
+        self.assertNotIn("lazy_commands", sys.modules)
+
+    def test_dispatch(self):
+        "Test that parsing a lazy subcommand imports and runs it."
+        self.assertEqual(self.parser.parse(["greet", "you"]), "hello, you")
+        self.assertIn("lazy_commands", sys.modules)
+        greet = self.parser.subparsers["greet"]
+        self.assertIs(greet.parent, self.parser)
+        self.assertEqual(greet.description, "Greet someone.")
+
+
+class SuggestionCase(unittest.TestCase):
+    def setUp(self):
+        import first_case
+        self.parser = first_case.parser
+
+    def assertSuggests(self, arguments, suggestion):
+        try:
+            self.parser.parse(arguments)
+        except NameError as e:
+            self.assertIn("Did you mean %s?" % suggestion, str(e))
+        else:
+            self.fail("no error")
+
+    def test_flag(self):
+        "Test that mistyped flags get suggestions."
+        self.assertSuggests(["hello", "--flga"], "'--flag'")
+
+    def test_subcommand(self):
+        "Test that mistyped subcommands get suggestions."
+        self.assertSuggests(["helo", "x"], "'hello'")
+
+    def test_nothing_close(self):
+        "Test that there are no suggestions when nothing is close."
+        try:
+            self.parser.parse(["hello", "--zzzzzzzz"])
+        except NameError as e:
+            self.assertNotIn("Did you mean", str(e))
+
+    def test_index(self):
+        "Test that the index finds the same words as a linear scan."
+        from argent.suggestions import Index, distance
+        words = ["cmd%d" % i for i in range(300)] + ["hello", "help", "yelp",
+            "command-number-12", "command-numbr-7", "x"]
+        index = Index(words)
+        for word in ("cmd1", "hepl", "cmd299x", "zzz", "command-number-1",
+                "y", ""):
+            for tolerance in (1, 2, 3):
+                self.assertEqual(index.search(word, tolerance), sorted(
+                    (distance(word, w), w) for w in words
+                    if distance(word, w) <= tolerance))
+
+    def test_distance(self):
+        "Test that distances are right, and stop early past the limit."
+        from argent.suggestions import distance
+        self.assertEqual(distance("kitten", "sitting"), 3)
+        self.assertEqual(distance("flaw", "lawn"), 2)
+        self.assertEqual(distance("", "abc"), 3)
+        self.assertEqual(distance("same", "same"), 0)
+        self.assertEqual(distance("abcdef", "azcdxf"), 2)
+        self.assertGreater(distance("kitten", "sitting", 2), 2)
+        self.assertEqual(distance("kitten", "sitting", 3), 3)
+
+
+class DocstringCase(unittest.TestCase):
+    def parse(self, doc):
+        from argent.docstrings import parse_docstring
+        return parse_docstring(doc)
+
+    def test_synonyms(self):
+        "Test that comma-separated names are synonyms."
+        descriptions, synonyms = self.parse("""Summary.
+
+        --f, --flag,--fl: a flag: with a colon.
+        """)
+        self.assertEqual(descriptions, {"__f": "a flag: with a colon."})
+        self.assertEqual(synonyms, {"__f": ["--flag", "--fl"]})
+
+    def test_multiline(self):
+        "Test that further-indented lines continue a description."
+        descriptions, _ = self.parse("""Summary.
+
+        Arguments:
+            first: the first
+                argument, continued.
+            second: the second.
+
+                not: a continuation, after a blank line.
+        """)
+        self.assertEqual(descriptions, {"first":
+            "the first argument, continued.", "second": "the second.",
+            "not": "a continuation, after a blank line."})
+
+    def test_not_descriptions(self):
+        "Test that prose and URLs with colons aren't descriptions."
+        descriptions, _ = self.parse("""Summary.
+
+        See this page: it's good.
+        http://example.com/x
+        """)
+        self.assertEqual(descriptions, {})
+
+    def test_headings(self):
+        "Test that only the sections under argument headings are read."
+        descriptions, _ = self.parse("""Summary.
+
+        Args:
+            name: a name.
+        Returns:
+            count: not an argument.
+        Other Options:
+            size: not one either.
+        Flags:
+            --v: a flag.
+        """)
+        self.assertEqual(descriptions, {"name": "a name.", "__v": "a flag."})
+
+    def test_other_headings(self):
+        "Test that other headings don't matter without argument headings."
+        descriptions, synonyms = self.parse("""Summary.
+
+        Example:
+            x: the x.
+            --v, --verbose: be verbose.
+        """)
+        self.assertEqual(descriptions, {"x": "the x.", "__v": "be verbose."})
+        self.assertEqual(synonyms, {"x": [], "__v": ["--verbose"]})
+        descriptions, _ = self.parse("""Summary.
+
+        Returns:
+            count: not an argument.
+        Arguments:
+            name: a name.
+        """)
+        self.assertEqual(descriptions, {"name": "a name."})
+
+
+class ConversionCase(unittest.TestCase):
+    def setUp(self):
+        from argent import Parser
+        def scale(value, factor=2, offset=0.5, verbose=False):
+            "Scale a value."
+            return value * factor + offset, verbose
+        scale.__annotations__ = {"value": int}
+        self.parser = Parser.from_function(scale)
+
+    def test_inferred_types(self):
+        "Test that types come from annotations and defaults."
+        self.assertEqual([a.type for a in self.parser.args],
+                [int, int, float, bool])
+        self.assertEqual(self.parser.parse(["3", "4", "1.5", "yes"]),
+                (13.5, True))
+
+    def test_strings_unconverted(self):
+        "Test that arguments without a type are left as strings."
+        import first_case
+        [arg] = first_case.hello.args
+        self.assertIs(arg.converter, None)
+
+    def test_string_annotations(self):
+        "Test that annotations postponed into strings still convert."
+        from argent import Parser
+        def count(number, name="x"):
+            return number, name
+        count.__annotations__ = {"number": "int", "name": "str"}
+        self.assertEqual(Parser.from_function(count).parse(["3", "y"]),
+                (3, "y"))
+        count.__annotations__ = {"number": "Undefined[int]"}
+        self.assertEqual(Parser.from_function(count).parse(["3"]), ("3", "x"))
+
+    @unittest.skipIf(sys.version_info < (3, 5), "needs typing")
+    def test_typing_annotations(self):
+        "Test that Optional[X] means X and other typing hints are ignored."
+        import typing
+        from argent import Parser
+        def count(number, names):
+            return number, names
+        count.__annotations__ = {"number": typing.Optional[int],
+                "names": typing.List[str]}
+        self.assertEqual(Parser.from_function(count).parse(["3", "abc"]),
+                (3, "abc"))
+
+    def test_scalar_defaults(self):
+        "Test that only scalar defaults give arguments a type."
+        from argent import Parser
+        def collect(items=[], mapping={}):
+            return items, mapping
+        self.assertEqual(Parser.from_function(collect).parse(["abc", "de"]),
+                ("abc", "de"))
+
+    def test_conversion_error(self):
+        "Test that conversion errors name the argument."
+        try:
+            self.parser.parse(["3", "four"])
+        except ValueError as e:
+            self.assertIn("factor", str(e))
+        else:
+            self.fail("no error")
+
+
+class VariadicCase(unittest.TestCase):
+    def setUp(self):
+        from argent import Parser
+        def total(_negate, start, *values):
+            """Add up some values.
+
+            values: the values to add.
+            """
+            return _negate, start, values
+        total.__annotations__ = {"values": int}
+        self.parser = Parser.from_function(total)
+
+    def test_variadic(self):
+        "Test that extra positional arguments go to `*args`."
+        self.assertIsNot(self.parser.variadic, None)
+        self.assertEqual(self.parser.parse(["-negate", "a", "1", "2"]),
+                (True, "a", (1, 2)))
+        self.assertEqual(self.parser.parse(["a"]), (False, "a", ()))
+
+    def test_bulk_conversion(self):
+        "Test that values are converted all at once, however big."
+        big = 10 ** 20
+        self.assertEqual(self.parser.variadic.converter(["1", str(big)]),
+                (1, big))
+        self.assertEqual(self.parser.parse(["a", str(big)]),
+                (False, "a", (big,)))
+        self.assertRaises(ValueError, self.parser.parse, ["a", "1", "x"])
+
+    def test_strings(self):
+        "Test that string `*args` are passed through as they are."
+        from argent import Parser
+        parser = Parser.from_function(lambda *words: words)
+        self.assertEqual(parser.parse(["a", "b"]), ("a", "b"))
+
+    def test_help(self):
+        "Test that `*args` shows up in help messages."
+        message = self.parser.help.render(80)
+        self.assertIn("[values ...]", message)
+        self.assertIn("the values to add.", message)
+
+
+class ResponseFileCase(unittest.TestCase):
+    def setUp(self):
+        import first_case
+        self.directory = tempfile.mkdtemp()
+        first_case.parser.response_file_prefix = "@"
+
+    def tearDown(self):
+        import first_case
+        first_case.parser.response_file_prefix = None
+        shutil.rmtree(self.directory)
+
+    def write(self, name, contents):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as f:
+            f.write(contents)
+        return path
+
+    def test_expansion(self):
+        "Test that response files expand into the arguments in them."
+        import first_case
+        path = self.write("args", b"hello\n--f\r\n\ntwo words\n")
+        self.assertEqual(first_case.parser.parse(["@" + path]), "two words")
+
+    def test_variadic(self):
+        "Test that a large response file fills `*args`."
+        from argent import Parser
+        parser = Parser.from_function(lambda *ids: len(ids),
+                response_file_prefix="@")
+        path = self.write("ids", b"".join([b"%d\n" % i
+            for i in range(100000)]))
+        self.assertEqual(parser.parse(["@" + path, "x"]), 100001)
+
+    def test_empty(self):
+        "Test that an empty response file expands to nothing."
+        import first_case
+        path = self.write("empty", b"")
+        self.assertEqual(first_case.parser.parse(["hello", "@" + path]),
+                "goodbye")
+
+    def test_off_by_default(self):
+        "Test that values starting with @ are left alone unless asked."
+        from argent import Parser
+        parser = Parser.from_function(lambda name: name)
+        self.assertEqual(parser.parse(["@alice"]), "@alice")
+
+    def test_missing(self):
+        "Test that a response file that isn't there is an argument error."
+        import first_case
+        self.assertRaises(NameError, first_case.parser.parse,
+                ["hello", "@" + os.path.join(self.directory, "missing")])
+
+
+class TraceCase(unittest.TestCase):
+    def setUp(self):
+        from argent import Parser
+        self.events = []
+        Parser.add_hook(self.events.append)
+
+    def tearDown(self):
+        from argent import Parser
+        Parser.remove_hook(self.events.append)
+
+    def test_phases(self):
+        "Test that building and parsing send events for each phase."
+        from argent import Parser
+        def fn(_a, b):
+            "A function."
+            return b
+        parser = Parser.from_function(fn)
+        self.assertEqual(parser.parse(["-a", "x"]), "x")
+        self.assertEqual([e["name"] for e in self.events],
+                ["introspect", "construct", "dispatch", "bind", "call"])
+        bind = self.events[3]
+        self.assertEqual((bind["args"]["tokens"], bind["args"]["flags"]),
+                (2, 1))
+
+    def test_chrome_trace(self):
+        "Test that events can be saved as a Chrome trace."
+        from argent.trace import ChromeTrace, add_hook, remove_hook
+        import first_case
+        directory = tempfile.mkdtemp()
+        try:
+            trace = ChromeTrace(os.path.join(directory, "trace.json"))
+            add_hook(trace)
+            try:
+                first_case.parser.parse(["hello", "--f"])
+            finally:
+                remove_hook(trace)
+            trace.save()
+            with open(trace.path) as f:
+                events = json.load(f)["traceEvents"]
+            self.assertEqual(events[0]["args"]["depth"], 1)
+            self.assertEqual(set(e["ph"] for e in events), set(["X"]))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_inactive(self):
+        "Test that nothing is measured without any hooks."
+        from argent import Parser, trace
+        Parser.remove_hook(self.events.append)
+        try:
+            self.assertFalse(trace.active)
+        finally:
+            Parser.add_hook(self.events.append)
+
+
+class MemoryCase(unittest.TestCase):
+    def test_no_dicts(self):
+        "Test that parsers and arguments don't each carry a __dict__."
+        import first_case
+        self.assertFalse(hasattr(first_case.hello, "__dict__"))
+        self.assertFalse(hasattr(first_case.hello.args[0], "__dict__"))
+
+    def test_shared_help_tables(self):
+        "Test that parsers that only take --help share its tables."
+        import first_case
+        something = first_case.parser.subparsers["something"]
+        self.assertIs(something._flag_table, first_case.parser._flag_table)
+
+    @unittest.skipIf(sys.version_info < (3, 4), "needs tracemalloc")
+    def test_parser_size(self):
+        """Test that a big tree of simple subcommands is much smaller than the
+        same tree made of objects with a __dict__ each, measured the same way
+        in the same interpreter.
+        """
+        import tracemalloc
+        import types
+        from argent import Parser
+        from argent.arguments import help_arg
+        def template(name, count=1):
+            "A subcommand."
+        functions = [types.FunctionType(template.__code__, {}, "cmd%d" % i,
+            template.__defaults__) for i in range(1000)]
+        for fn in functions:
+            fn.__doc__ = template.__doc__
+        def measure(build):
+            tracemalloc.start()
+            try:
+                tree = build()
+                return tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+        def argent_tree():
+            parser = Parser.from_function(template)
+            for fn in functions:
+                parser.subparse(fn)
+            return parser
+        class Plain(object):
+            pass
+        def plain(**attributes):
+            obj = Plain()
+            obj.__dict__.update(attributes)
+            return obj
+        def plain_tree():
+            # what each parser and argument held, with no sharing.
+            tree = {}
+            for fn in functions:
+                args = [plain(name=n, underscored=n, default=d,
+                    variadic=False, flag=False, necessary=d is None, type=t,
+                    converter=t, description="", synonym_names=[n])
+                    for n, d, t in [("name", None, None), ("count", 1, int)]]
+                tree[fn.__name__] = plain(subparsers={}, function=fn,
+                    coroutine=False, parent=None, help=plain(parser=None),
+                    variadic=None, signature=("name", "count"),
+                    flags=[help_arg], args=args, name=fn.__name__,
+                    description=fn.__doc__, output=None,
+                    flag_table={"--h": help_arg, "--help": help_arg},
+                    flag_defaults={}, slots=[(a.underscored, a.converter,
+                        a.name) for a in args])
+            return tree
+        self.assertLess(measure(argent_tree), 0.75 * measure(plain_tree))
+
+
+class StreamCase(unittest.TestCase):
+    def setUp(self):
+        from argent import Parser, Stream
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "input")
+        with open(self.path, "wb") as f:
+            f.write(b"one\ntwo\nthree\n")
+        def count(lines=Stream):
+            "Count lines."
+            return sum(1 for line in lines)
+        def chunks(data=Stream(binary=True, chunk_size=4)):
+            "Split data into chunks."
+            return list(data)
+        self.count = Parser.from_function(count)
+        self.chunks = Parser.from_function(chunks)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_path(self):
+        "Test that a stream argument reads the file it's given."
+        self.assertEqual(self.count.parse([self.path]), 3)
+
+    def test_stdin(self):
+        "Test that a stream argument reads stdin if it isn't given."
+        stdin = sys.stdin
+        try:
+            with open(self.path) as sys.stdin:
+                self.assertEqual(self.count.parse([]), 3)
+                sys.stdin.seek(0)
+                self.assertEqual(self.count.parse(["-"]), 3)
+        finally:
+            sys.stdin = stdin
+
+    def test_annotated_stdin(self):
+        "Test that a stream argument by annotation also reads stdin."
+        from argent import Parser, Stream
+        def count(lines):
+            "Count lines."
+            return sum(1 for line in lines)
+        count.__annotations__ = {"lines": Stream}
+        parser = Parser.from_function(count)
+        self.assertFalse(parser.args[0].necessary)
+        self.assertEqual(parser.validate([]), [])
+        stdin = sys.stdin
+        try:
+            with open(self.path) as sys.stdin:
+                self.assertEqual(parser.parse([]), 3)
+        finally:
+            sys.stdin = stdin
+        self.assertEqual(parser.parse([self.path]), 3)
+
+    def test_chunks(self):
+        "Test that binary streams are read in chunks."
+        self.assertEqual(self.chunks.parse([self.path]),
+                [b"one\n", b"two\n", b"thre", b"e\n"])
+
+    def test_iterable(self):
+        "Test that a stream can read from an iterable instead of a file."
+        from argent import Stream
+        self.assertEqual(list(Stream().open(iter(["a", "b"]))), ["a", "b"])
+
+
+class OutputCase(unittest.TestCase):
+    def emit(self, value, format):
+        from argent.output import emit
+        stream = io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+        emit(value, format, stream, buffer_size=8)
+        return stream.getvalue()
+
+    def records(self):
+        for i in range(3):
+            yield {"n": i}
+
+    def test_plain(self):
+        "Test that plain output writes an item per line."
+        self.assertEqual(self.emit((x for x in "abc"), "plain"), "a\nb\nc\n")
+        self.assertEqual(self.emit("abc", "plain"), "abc\n")
+        self.assertEqual(self.emit(None, "plain"), "")
+
+    def test_json(self):
+        "Test that streams are written as JSON lists."
+        self.assertEqual(json.loads(self.emit(self.records(), "json")),
+                [{"n": 0}, {"n": 1}, {"n": 2}])
+        self.assertEqual(json.loads(self.emit(iter([]), "json")), [])
+
+    def test_jsonl(self):
+        "Test that JSON lines output writes a JSON value per line."
+        self.assertEqual([json.loads(line) for line in self.emit(
+            self.records(), "jsonl").splitlines()],
+            [{"n": 0}, {"n": 1}, {"n": 2}])
+
+    def test_broken_pipe(self):
+        "Test that a reader going away stops the stream quietly."
+        import errno
+        from argent.output import emit
+        class Closed(object):
+            def write(self, data):
+                raise IOError(errno.EPIPE, "Broken pipe")
+        closed = []
+        def forever():
+            try:
+                while True:
+                    yield "y"
+            finally:
+                closed.append(True)
+        self.assertFalse(emit(forever(), "plain", Closed(), buffer_size=8))
+        self.assertEqual(closed, [True])
+
+    def test_inherited(self):
+        "Test that subparsers get their parent's output format."
+        from argent import Parser
+        parser = Parser.from_function(lambda: None, output="jsonl")
+        self.assertEqual(parser.subparse(lambda: None).output, "jsonl")
+
+
+class IntrospectionCacheCase(unittest.TestCase):
+    def setUp(self):
+        from argent import cache
+        self.directory = tempfile.mkdtemp()
+        self.cache = cache.enable(self.directory)
+
+    def tearDown(self):
+        from argent import cache
+        cache.disable()
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        "Test that a cached function gets the same arguments as before."
+        from argent.arguments import arguments_from_function
+        import first_case
+        fn = first_case.hello.function
+        fresh = arguments_from_function(fn)
+        self.assertTrue(os.listdir(self.directory))
+        cached = arguments_from_function(fn)
+        self.assertEqual([(a.name, a.default, a.description, a.synonym_names)
+                for a in fresh], [(a.name, a.default, a.description,
+                a.synonym_names) for a in cached])
+
+    def test_docstring_invalidates(self):
+        "Test that changing a function's docstring misses the cache."
+        def fn(something):
+            "A function."
+        key = self.cache.key(fn)
+        fn.__doc__ = "Another function."
+        self.assertNotEqual(key, self.cache.key(fn))
+
+    def test_eviction(self):
+        "Test that the cache stays under its maximum size."
+        self.cache.max_size = 0
+        self.cache.put(lambda: None, ([], None, {}, {}))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_writes_scan_once(self):
+        "Test that filling the cache doesn't look at every entry every time."
+        listdir = os.listdir
+        scans = []
+        def counted(path):
+            scans.append(path)
+            return listdir(path)
+        os.listdir = counted
+        try:
+            for i in range(100):
+                self.cache.write("entry%d" % i, b"x" * 100)
+            self.assertEqual(len(scans), 1)
+            self.cache.max_size = 5000
+            self.cache.write("entry100", b"x" * 100)
+        finally:
+            os.listdir = listdir
+        self.assertEqual(len(scans), 2)
+        self.assertEqual(len(os.listdir(self.directory)), 37)
+        for i in range(10):
+            self.cache.write("entry%d" % (i + 101), b"x" * 100)
+        self.assertEqual(len(os.listdir(self.directory)), 47)
+
+
+class ResultCacheCase(unittest.TestCase):
+    def setUp(self):
+        from argent import Parser
+        from argent.cache import ResultCache
+        self.directory = tempfile.mkdtemp()
+        self.cache = ResultCache(self.directory)
+        self.calls = []
+        def square(number):
+            "Square a number."
+            self.calls.append(number)
+            return int(number) ** 2
+        self.parser = Parser.from_function(square, cache=self.cache)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_hit(self):
+        "Test that a second call comes from the cache."
+        self.assertEqual(self.parser.parse(["3"]), 9)
+        self.assertEqual(self.parser.parse(["3"]), 9)
+        self.assertEqual(self.calls, ["3"])
+        self.assertEqual(self.parser.parse(["4"]), 16)
+        self.assertEqual(self.calls, ["3", "4"])
+
+    def test_no_cache(self):
+        "Test that --no-cache runs the function anyway."
+        self.parser.parse(["3"])
+        self.assertEqual(self.parser.parse(["3", "--no-cache"]), 9)
+        self.assertEqual(self.calls, ["3", "3"])
+
+    def test_ttl(self):
+        "Test that results expire."
+        self.cache.ttl = 0
+        self.parser.parse(["3"])
+        self.parser.parse(["3"])
+        self.assertEqual(self.calls, ["3", "3"])
+
+    def test_generators(self):
+        "Test that generators aren't cached."
+        from argent import Parser
+        def count(up_to):
+            return iter(range(int(up_to)))
+        parser = Parser.from_function(count, cache=self.cache)
+        self.assertEqual(list(parser.parse(["3"])), [0, 1, 2])
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_subparse(self):
+        "Test that subparsers can cache their results."
+        from argent import Parser
+        parser = Parser()
+        @parser.subparse(cache=self.cache)
+        def double(number):
+            "Double a number."
+            self.calls.append(number)
+            return int(number) * 2
+        self.assertTrue(any(f.name == "--no-cache" for f in double.flags))
+        parser.parse(["double", "5"])
+        self.assertEqual(parser.parse(["double", "5"]), 10)
+        self.assertEqual(self.calls, ["5"])
+
+    def test_streams(self):
+        "Test that calls that read stdin aren't cached."
+        from argent import Parser, Stream
+        def count(lines=Stream):
+            "Count lines."
+            return sum(1 for line in lines)
+        parser = Parser.from_function(count, cache=self.cache)
+        path = os.path.join(self.directory, "input")
+        stdin = sys.stdin
+        try:
+            for contents, expected in [("one\n", 1), ("one\ntwo\n", 2)]:
+                with open(path, "w") as f:
+                    f.write(contents)
+                with open(path) as sys.stdin:
+                    self.assertEqual(parser.parse([]), expected)
+        finally:
+            sys.stdin = stdin
+        self.assertEqual(os.listdir(self.directory), ["input"])
+
+    def test_working_directory(self):
+        "Test that the same call in another directory misses the cache."
+        here = os.getcwd()
+        try:
+            self.parser.parse(["3"])
+            os.chdir(self.directory)
+            self.parser.parse(["3"])
+        finally:
+            os.chdir(here)
+        self.assertEqual(self.calls, ["3", "3"])
+
+    def test_paths(self):
+        "Test that changing a file misses the cache, if it's asked to."
+        from argent import Parser
+        from argent.cache import ResultCache
+        path = os.path.join(self.directory, "input")
+        def size(name):
+            "Measure a file."
+            self.calls.append(name)
+            return os.path.getsize(name)
+        cache = ResultCache(os.path.join(self.directory, "results"))
+        paths = ResultCache(os.path.join(self.directory, "paths"),
+                paths=True)
+        for parser in Parser.from_function(size, cache=cache), \
+                Parser.from_function(size, cache=paths):
+            with open(path, "w") as f:
+                f.write("one")
+            parser.parse([path])
+            with open(path, "w") as f:
+                f.write("three")
+            self.calls.append(parser.parse([path]))
+        self.assertEqual(self.calls, [path, 3, path, path, 5])
+
+
+class ImportCostCase(unittest.TestCase):
+    # importing argent and running a command shouldn't load any of these.
+    expensive = ["argent.help", "clint", "inspect", "re", "array",
+            "threading", "asyncio", "json"]
+
+    def test_imports(self):
+        "Test that running a command imports nothing it doesn't need."
+        import subprocess
+        script = "\n".join(["import sys",
+            "before = set(sys.modules)",
+            "from argent import Parser",
+            "def hello(name, __loud=False): return name",
+            "Parser.from_function(hello).parse(['world', '--loud'])",
+            "print(' '.join(set(sys.modules) - before))"])
+        environment = dict(os.environ)
+        environment["PYTHONPATH"] = os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__)))
+        environment.pop("ARGENT_TRACE", None)
+        output = subprocess.check_output([sys.executable, "-c", script],
+                env=environment)
+        imported = output.decode("ascii").split()
+        self.assertIn("argent.parser", imported)
+        self.assertEqual([m for m in self.expensive if m in imported], [])
+
+
+class PrepareCase(unittest.TestCase):
+    def setUp(self):
+        import first_case
+        self.parser = first_case.parser
+
+    def test_prepare(self):
+        "Test that a prepared command line can be run again and again."
+        invocation = self.parser.prepare("hello --flag 'hi there'")
+        self.assertIs(invocation.parser, self.parser.subparsers["hello"])
+        self.assertEqual(invocation.kwargs, {"__f": True,
+            "something": "hi there"})
+        self.assertEqual(invocation(), "hi there")
+        self.assertEqual(invocation(), "hi there")
+
+    def test_values(self):
+        "Test that help and errors come back rather than being shown."
+        stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        try:
+            helped = self.parser.prepare(["hello", "--help"], prog="bot")
+            failed = self.parser.prepare(["hello", "--flga"])
+            written = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(written, "")
+        self.assertTrue(helped.help.startswith("usage: bot hello "))
+        self.assertEqual(helped(), helped.help)
+        self.assertIsInstance(failed.error, NameError)
+        self.assertRaises(NameError, failed)
+
+    def test_threads(self):
+        "Test that threads can prepare and run command lines at once."
+        import threading
+        from argent import Parser
+        parser = Parser.from_function(lambda: None)
+        parser.subparse_lazy("lazy_commands:greet")
+        results = {}
+        def work(n):
+            results[n] = parser.prepare(["greet", str(n)])()
+        threads = [threading.Thread(target=work, args=(n,))
+                for n in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, dict((n, "hello, %d" % n)
+            for n in range(16)))
+
+
+class ValidationCase(unittest.TestCase):
+    def setUp(self):
+        import first_case
+        self.parser = first_case.parser
+
+    def assertDiagnoses(self, command_line, expected):
+        diagnostics = self.parser.validate(command_line)
+        self.assertEqual([(d.kind, d.position) for d in diagnostics], expected)
+
+    def test_valid(self):
+        "Test that good command lines have no diagnostics."
+        self.assertDiagnoses("hello --f 'two words'", [])
+        self.assertDiagnoses(["something", "a", "b"], [])
+        self.assertDiagnoses("hello --nope --help", [("unknown-flag", 1)])
+
+    def test_diagnostics(self):
+        "Test that every problem is found, at its position."
+        self.assertDiagnoses("hello --flga a b", [("unknown-flag", 1),
+            ("too-many-arguments", 3)])
+        self.assertDiagnoses("something a", [("too-few-arguments", 2)])
+        self.assertDiagnoses("hell", [("unknown-subcommand", 0)])
+        self.assertDiagnoses("hello 'a", [("syntax", 0)])
+
+    def test_invalid_value(self):
+        "Test that arguments that don't convert are found."
+        from argent import Parser
+        def add(a=0, *numbers):
+            return a + sum(numbers)
+        self.parser = Parser.from_function(add)
+        self.assertDiagnoses("1 2 3", [])
+        self.assertDiagnoses("x 2 y", [("invalid-value", 0)])
+
+    def test_loading_errors(self):
+        "Test that unreadable files and unloadable subcommands are reported."
+        from argent import Parser
+        parser = Parser(response_file_prefix="@")
+        parser.subparse_lazy("nonexistent_module:nothing", "broken")
+        self.parser = parser
+        self.assertDiagnoses("broken @/nonexistent", [("unreadable", 0)])
+        self.assertDiagnoses("broken a", [("unloadable", 0)])
+        self.assertEqual(list(map(len, parser.validate_many(["broken",
+            "broken"]))), [1, 1])
+
+    def test_not_called(self):
+        "Test that validating never calls the function."
+        from argent import Parser
+        def explode(something):
+            raise AssertionError("called")
+        parser = Parser.from_function(explode)
+        self.assertEqual(list(parser.validate_many(["x", "x y", ["z"]])),
+                [[], [parser.validate("x y")[0]], []])
+
+
+class PipelineCase(unittest.TestCase):
+    def setUp(self):
+        import pipeline_case
+        self.parser = pipeline_case.parser
+
+    def tearDown(self):
+        self.parser.pipeline = None
+
+    def test_pipeline(self):
+        "Test that each stage reads what the one before returned."
+        self.assertEqual(self.parser.parse(["numbers", "5", "--", "double",
+            "--", "total"]), 20)
+        doubled = self.parser.parse(["numbers", "3", "--", "double"])
+        self.assertEqual(list(doubled), [0, 2, 4])
+
+    def test_concurrent(self):
+        "Test that stages can run in their own threads or processes."
+        expected = sum(range(0, 20000, 2))
+        for mode in ["threads", "processes"]:
+            self.parser.pipeline = mode
+            self.assertEqual(self.parser.parse(["numbers", "10000", "--",
+                "double", "--", "total"]), expected)
+
+    def test_errors(self):
+        "Test that an error in any stage comes out of the pipeline."
+        for mode in [None, "threads", "processes"]:
+            self.parser.pipeline = mode
+            self.assertRaises(ValueError, self.parser.parse, ["numbers", "9",
+                "--", "fail", "--", "total"])
+
+    def test_early_stop(self):
+        "Test that stages stop when the last one doesn't read all of them."
+        import multiprocessing
+        import threading
+        threads = threading.active_count()
+        for mode in ["threads", "processes"]:
+            self.parser.pipeline = mode
+            self.assertEqual(self.parser.parse(["numbers", "100000", "--",
+                "double", "--", "first"]), 0)
+            self.assertRaises(ValueError, list, self.parser.parse([
+                "numbers", "100000", "--", "double", "--", "fail"]))
+            doubled = self.parser.parse(["numbers", "100000", "--",
+                "double"])
+            self.assertEqual(next(doubled), 0)
+            doubled.close()
+            self.assertEqual(threading.active_count(), threads)
+            self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_lazy(self):
+        "Test that arguments are only read as far as they're needed."
+        def arguments():
+            yield "numbers"
+            yield "--nope"
+            raise AssertionError("read too far")
+        self.assertRaises(NameError, self.parser.parse, arguments())
+
+    def test_response_file(self):
+        "Test that a pipeline can come from a response file."
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "args")
+            with open(path, "wb") as f:
+                f.write(b"3\n--\ndouble\n")
+            self.parser.response_file_prefix = "@"
+            self.assertEqual(self.parser.parse(["numbers", "@" + path,
+                "--", "total"]), 6)
+        finally:
+            self.parser.response_file_prefix = None
+            shutil.rmtree(directory)
+
+    def test_not_prepared(self):
+        "Test that preparing a pipeline is an error, rather than a flag."
+        invocation = self.parser.prepare("numbers 3 -- total")
+        self.assertIsInstance(invocation.error, NameError)
+        self.assertIn("pipeline", str(invocation.error))
+
+    def test_not_piped(self):
+        "Test that every stage after the first has to read a stream."
+        self.assertRaises(NameError, self.parser.parse, ["numbers", "3", "--",
+            "numbers", "2"])
+        self.assertEqual([(d.kind, d.position) for d in self.parser.validate(
+            "numbers 3 -- numbers 2 -- total --nope")], [("not-piped", 3),
+            ("unknown-flag", 7)])
+
 
 if __name__ == "__main__":
     unittest.main()